@@ -0,0 +1,245 @@
+"""
+Throughput benchmark for MusicBot.on_message (the chat-response side of it - portmanteaus, keymash, keyword responses).
+
+Builds a scratch directory with a generated responses.txt (--keys trigger keys, 10k+ by default), default and
+guild emote files, then drives on_message with stubbed discord messages/channels and prints the per-stage timings
+from MusicBot.stage_timer along with messages per second. Nothing is sent anywhere.
+
+Everything is seeded, so two runs with the same arguments see the same rules and the same messages.
+
+Usage (from the repo root):
+    python benchmarks/on_message_bench.py [--messages 5000] [--keys 12000] [--seed 1] [--workers 0] [--corpus file.txt] [--output bench_output.txt]
+
+--corpus is a text file of recorded messages (one per line) that gets mixed in with the synthetic ones.
+"""
+
+import os
+import sys
+import time
+import types
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+os.makedirs("logs", exist_ok=True) #musicbot/__init__.py opens its log file on import
+
+allow_requests = True #quantumrandom uses requests. We never call it here
+from musicbot.bot import MusicBot
+from musicbot.keywords import RuleStore
+from musicbot.constructs import StageTimer
+from musicbot.analysis import AnalysisPool
+
+GUILD_ID = 424242
+STAGES = ["analysis", "portmanteau", "keymash", "rules", "matching", "typos", "sending", "ocr"]
+SUBSTAGES = {"portmanteau", "keymash"} #timed inside analysis (maybe in parallel, in workers), so they're part of its total
+SYLLABLES = ["ba", "be", "bi", "bo", "bu", "ka", "ke", "ki", "ko", "ku", "ma", "me", "mi", "mo", "mu", "na", "ne", "ni", "no",
+             "ra", "re", "ri", "ro", "ru", "sa", "se", "si", "so", "su", "ta", "te", "ti", "to", "tu", "la", "le", "li", "lo"]
+TAGS = ["", "", "", "", "{a}", "{alone}", "{rare}", "{fast}", "{nodel}", "{noimg}"]
+RESPONSE_TAGS = ["", "", "", "", "{author}", "{break}", "{trail}", "{random}", "{react}{👍}"]
+
+
+def make_word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_rules(rng, key_count, keys_per_line=4):
+    """
+    Generates rule lines with key_count trigger keys total. Returns (lines, keys).
+    """
+    lines = []
+    keys = []
+    while len(keys) < key_count:
+        line_keys = []
+        for _ in range(rng.randint(1, keys_per_line)):
+            key = " ".join(make_word(rng) for _ in range(rng.choice([1, 1, 1, 2])))
+            keys.append(key)
+            line_keys.append(key+rng.choice(TAGS))
+        responses = [make_word(rng)+" "+make_word(rng)+rng.choice(RESPONSE_TAGS) for _ in range(rng.randint(1, 4))]
+        lines.append(",".join(line_keys)+";"+",".join(responses))
+    return lines, keys
+
+
+def make_messages(rng, count, keys, vocabulary, corpus):
+    """
+    Mixes plain chatter (the vast majority of real traffic), messages containing triggers,
+    two/three word messages (portmanteaus), keymashes, and recorded messages from the corpus.
+    """
+    messages = []
+    for _ in range(count):
+        kind = rng.random()
+        if corpus and kind < 0.3:
+            messages.append(rng.choice(corpus))
+        elif kind < 0.55:
+            messages.append(" ".join(rng.choice(vocabulary) for _ in range(rng.randint(4, 25))))
+        elif kind < 0.75:
+            words = [rng.choice(vocabulary) for _ in range(rng.randint(2, 12))]
+            for _ in range(rng.randint(1, 3)):
+                words.insert(rng.randint(0, len(words)), rng.choice(keys))
+            messages.append(" ".join(words))
+        elif kind < 0.9:
+            messages.append(" ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 3))))
+        else:
+            messages.append("".join(rng.choice("asdfghjkl;qwertyuiop") for _ in range(rng.randint(11, 40))))
+    return messages
+
+
+class StubSentMessage:
+    def __init__(self, content):
+        self.content = content
+
+    async def add_reaction(self, emoji):
+        return
+
+
+class StubChannel:
+    def __init__(self, guild):
+        self.guild = guild
+        self.id = 1
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        return StubSentMessage(content)
+
+
+class StubMessage:
+    def __init__(self, content, author, channel, message_id):
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.id = message_id
+        self.attachments = []
+        self.reference = None
+
+    async def add_reaction(self, emoji):
+        return
+
+    async def delete(self):
+        return
+
+
+class StubScorekeeper:
+    def __init__(self):
+        self.scores = {}
+
+    def change_score(self, key, scoreboard_name, value=1, increment=True):
+        score = self.scores.get((key, scoreboard_name), 0)+value if increment else value
+        self.scores[(key, scoreboard_name)] = score
+        return score
+
+
+def make_bot(workdir, workers):
+    """
+    Builds a MusicBot without connecting to anything. Only the attributes on_message's chat path needs are filled in.
+    """
+    bot = MusicBot.__new__(MusicBot)
+    bot._connection = types.SimpleNamespace(user=types.SimpleNamespace(id=1, name="bnuuy", bot=True))
+
+    async def wait_until_ready():
+        return
+    bot.wait_until_ready = wait_until_ready
+
+    bot.load_configs()
+    bot.unfun_guilds = []
+    bot.config = types.SimpleNamespace(command_prefix="&", bound_channels=set(), unbound_servers=False, owner_id=0, usealias=False)
+    bot.blacklist = set()
+    bot.scorekeeper = StubScorekeeper()
+    bot.rule_store = RuleStore()
+    bot.stage_timer = StageTimer(enabled=True)
+    bot.analysis_pool = AnalysisPool(workers, 0) #no budget, so every run does the same work
+    return bot
+
+
+def setup_workdir(workdir, rng, key_count):
+    os.makedirs(os.path.join(workdir, "emotes"))
+    os.makedirs(os.path.join(workdir, "config"))
+    os.makedirs(os.path.join(workdir, "image_cache"))
+    shutil.copytree(os.path.join(REPO_ROOT, "keymash_data"), os.path.join(workdir, "keymash_data"))
+    shutil.copy(os.path.join(REPO_ROOT, "config", "custom_configs.txt"), os.path.join(workdir, "config", "custom_configs.txt"))
+
+    lines, keys = make_rules(rng, key_count)
+    emote_lines, emote_keys = make_rules(rng, max(key_count//20, 1))
+    guild_lines, guild_keys = make_rules(rng, max(key_count//20, 1))
+    with open(os.path.join(workdir, "responses.txt"), "w") as f:
+        f.write("\n".join(lines)+"\n")
+    with open(os.path.join(workdir, "emotes", "default.txt"), "w") as f:
+        f.write("\n".join(emote_lines)+"\n")
+    with open(os.path.join(workdir, "emotes", "{}.txt".format(GUILD_ID)), "w") as f:
+        f.write("\n".join(guild_lines)+"\n")
+    return keys+emote_keys+guild_keys
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    corpus = []
+    if args.corpus:
+        with open(os.path.abspath(args.corpus), "r") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+
+    workdir = tempfile.mkdtemp(prefix="on_message_bench_")
+    try:
+        keys = setup_workdir(workdir, rng, args.keys)
+        vocabulary = [make_word(rng) for _ in range(2000)]
+        messages = make_messages(rng, args.messages, keys, vocabulary, corpus)
+
+        os.chdir(workdir)
+        load_start = time.perf_counter()
+        bot = make_bot(workdir, args.workers)
+        bot.rule_store.ruleset_for(GUILD_ID)
+        load_time = time.perf_counter()-load_start
+
+        author = types.SimpleNamespace(id=1234, name="benchmarker", mention="<@1234>", bot=False)
+        channel = StubChannel(types.SimpleNamespace(id=GUILD_ID))
+        stub_messages = [StubMessage(text, author, channel, i) for i, text in enumerate(messages)]
+
+        random.seed(args.seed) #the bot uses the global RNG
+        loop = asyncio.new_event_loop()
+        start = time.perf_counter()
+        for message in stub_messages:
+            loop.run_until_complete(bot.on_message(message))
+        elapsed = time.perf_counter()-start
+        loop.close()
+        bot.analysis_pool.shutdown()
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    timer = bot.stage_timer
+    report = []
+    report.append("on_message benchmark: {} messages, {} trigger keys ({} rules), seed {}, {} analysis workers".format(len(messages), len(keys), len(bot.rule_store.ruleset_for(GUILD_ID)), args.seed, args.workers))
+    report.append("rule loading + compiling: {:.1f} ms".format(load_time*1000))
+    report.append("{:<14}{:>12}{:>16}".format("stage", "total ms", "us/message"))
+    for stage in STAGES:
+        total = timer.totals.get(stage, 0.0)
+        name = "  "+stage if stage in SUBSTAGES else stage
+        report.append("{:<14}{:>12.1f}{:>16.1f}".format(name, total*1000, total*1e6/len(messages)))
+    report.append("{:<14}{:>12.1f}{:>16.1f}".format("total", elapsed*1000, elapsed*1e6/len(messages)))
+    report.append("messages/second: {:.0f}".format(len(messages)/elapsed))
+    report.append("responses sent: {}".format(channel.sent))
+    report = "\n".join(report)
+
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report+"\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MusicBot.on_message throughput")
+    parser.add_argument("--messages", type=int, default=5000, help="number of messages to process")
+    parser.add_argument("--keys", type=int, default=12000, help="number of trigger keys in the generated responses.txt")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the generated rules, messages, and the bot's RNG")
+    parser.add_argument("--workers", type=int, default=0, help="analysis pool workers (0 runs the analysis inline)")
+    parser.add_argument("--corpus", default=None, help="text file of recorded messages (one per line) to mix in")
+    parser.add_argument("--output", default=None, help="also write the report to this file (e.g. bench_output.txt)")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark for musicbot/typos.py against the old character-by-character add_typos.
+
+Times both on long multi-response outputs (the kind on_message builds when several triggers fire at once) and
+compares what comes out: how often each character gets changed, what it gets changed into, and how often the
+trailing apostrophe shows up. Both should agree to within sampling noise.
+
+Usage (from the repo root):
+    python benchmarks/typos_bench.py [--sloppiness 0.02] [--length 1500] [--runs 2000] [--seed 1]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+os.makedirs("logs", exist_ok=True) #musicbot/__init__.py opens its log file on import
+
+allow_requests = True #quantumrandom uses requests. We never call it here
+from musicbot.typos import add_typos
+
+RESPONSES = ["fast af boii!", "You are {author}!", "no{break}haha jk!", "always there for you", "the time is 4:20 PM",
+             "hellooo there, how are you doing today?", "comma1,comma1", "poop {break}devil"]
+
+
+def legacy_add_typos(input, sloppiness_multiplier):
+    """
+    The original MusicBot.add_typos, kept here as the reference.
+    """
+    keyboard = ["qwertyuiop[","aasdfghjkl;","zzxcvbnm,./"]
+    output = ""
+    inkey = False
+    for i in range(len(input)):
+        letter = input[i]
+        if letter=="{":
+            inkey=True
+        if len(output)>0 and output[-1]=="}":
+            inkey=False
+        if not letter in "\n" and any(letter in bar for bar in keyboard) and not inkey:
+            while True:
+                if random.random()>=sloppiness_multiplier or sloppiness_multiplier>=1:
+                    break
+                y = 0 if letter in keyboard[0] else (1 if letter in keyboard[1] else 2)
+                x = keyboard[y].index(letter)
+                if random.random()<=0.5:
+                    x += random.randint(-1,1)
+                else:
+                    y += random.randint(-1,1)
+                y = max(0,min(y,2))
+                x = max(0,min(x,len(keyboard[y])-1))
+                letter = keyboard[y][x] if not keyboard[y][x]=="}" else ""
+        elif not inkey and letter=="!" and random.random()<=sloppiness_multiplier:
+            letter="1"
+        elif not inkey and letter==" " and random.random()<=sloppiness_multiplier:
+            letter = random.choice(["","  "])
+        output+=letter
+    return output + ("'" if random.random()<=sloppiness_multiplier else "")
+
+
+def make_text(rng, length):
+    parts = []
+    while sum(len(p) for p in parts) < length:
+        parts.append(rng.choice(RESPONSES))
+    return "\n".join(parts)
+
+
+def changes(original, typoed):
+    """
+    Counts substitutions for texts made only of letters (so both sides stay aligned).
+    """
+    counts = Counter()
+    for a, b in zip(original, typoed):
+        if a != b:
+            counts[(a, b)] += 1
+    return counts
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    text = make_text(rng, args.length)
+
+    timings = {}
+    for name, func in (("legacy", legacy_add_typos), ("table", add_typos)):
+        random.seed(args.seed)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            func(text, args.sloppiness)
+        timings[name] = time.perf_counter()-start
+
+    print("add_typos on {} characters x {} runs (sloppiness {})".format(len(text), args.runs, args.sloppiness))
+    for name, elapsed in timings.items():
+        print("  {:<8}{:>10.1f} ms{:>12.1f} us/call".format(name, elapsed*1000, elapsed*1e6/args.runs))
+    print("  speedup: {:.1f}x".format(timings["legacy"]/timings["table"]))
+
+    #distribution check on letters only, so substitutions line up
+    letters = "thequickbrownfoxjumpsoverthelazydog"*20
+    stats = {}
+    for name, func in (("legacy", legacy_add_typos), ("table", add_typos)):
+        random.seed(args.seed)
+        subs = Counter()
+        apostrophes = 0
+        for _ in range(args.runs):
+            out = func(letters, args.sloppiness)
+            if out.endswith("'"):
+                apostrophes += 1
+                out = out[:-1]
+            subs.update(changes(letters, out))
+        stats[name] = (subs, apostrophes)
+
+    total = len(letters)*args.runs
+    print("distribution over {} letters:".format(total))
+    for name, (subs, apostrophes) in stats.items():
+        print("  {:<8}changed {:.4%}, apostrophe {:.2%}".format(name, sum(subs.values())/total, apostrophes/args.runs))
+    legacy_subs, table_subs = stats["legacy"][0], stats["table"][0]
+    common = sorted(legacy_subs, key=lambda pair: -legacy_subs[pair])[:8]
+    print("  most common substitutions (legacy / table):")
+    for pair in common:
+        print("    {} -> {}: {} / {}".format(pair[0], pair[1], legacy_subs[pair], table_subs[pair]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the table-driven add_typos against the old one")
+    parser.add_argument("--sloppiness", type=float, default=0.02)
+    parser.add_argument("--length", type=int, default=1500, help="approximate length of the generated output")
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Builds keymash_data/keymash_model.npy, the reference distributions musicbot/keymash.py compares messages against.
+
+Each side can be trained from any number of corpus files: channel_archives exports (see &archive) or plain text with
+one message per line. A side that isn't given is carried over from the current model (or the old data_*.txt files).
+
+Usage:
+    python build_keymash_model.py [--english channel_archives/123.txt ...] [--keymash keymash_samples.txt ...] [--output keymash_data/keymash_model.npy]
+"""
+
+import os
+import sys
+import argparse
+
+os.makedirs("logs", exist_ok=True) #musicbot/__init__.py opens its log file on import
+allow_requests = True #quantumrandom uses requests. We never call it here
+from musicbot import keymash
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the keymash model from text corpora")
+    parser.add_argument("--english", nargs="+", default=[], help="corpus files of normal chat")
+    parser.add_argument("--keymash", nargs="+", default=[], help="corpus files of keymashes")
+    parser.add_argument("--data", default="keymash_data", help="directory of the current model, used for any side that isn't rebuilt")
+    parser.add_argument("--output", default=os.path.join("keymash_data", keymash.MODEL_FILE))
+    args = parser.parse_args()
+
+    current = keymash.load_model(args.data)
+    sides = {}
+    for side, files in (("eng", args.english), ("kma", args.keymash)):
+        if not files:
+            print("Keeping the current {} distribution".format(side))
+            sides[side] = current.eng if side=="eng" else current.kma
+            continue
+        texts = []
+        for path in files:
+            texts.extend(keymash.read_corpus(path))
+        print("Building the {} distribution from {} messages in {} files".format(side, len(texts), len(files)))
+        sides[side] = keymash.build_distribution(texts)
+
+    keymash.KeymashModel(sides["eng"], sides["kma"]).save(args.output)
+    print("Wrote {} (version {})".format(args.output, keymash.MODEL_VERSION))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Imports the json scoreboards (misc_data/scoreboards/*.json, plus anything still in their change log) into the SQLite
+scoreboard database, so SCOREBOARD_BACKEND can be switched to sqlite. Run it with the bot stopped.
+
+Boards already in the database are left alone unless --overwrite is given. Old generations of boards that use
+set_generation() (like yesterday's goku_attempts) are left out. The json files aren't touched.
+
+Usage:
+    python migrate_scoreboards.py [--source misc_data/scoreboards/] [--database misc_data/scores.db] [--overwrite]
+"""
+
+import os
+import sys
+import argparse
+
+os.makedirs("logs", exist_ok=True) #musicbot/__init__.py opens its log file on import
+allow_requests = True #quantumrandom uses requests. We never call it here
+from musicbot.scorekeeper import Scorekeeper
+from musicbot.sqlite_scorekeeper import SQLiteScorekeeper
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the json scoreboards into the SQLite scoreboard database")
+    parser.add_argument("--source", default=Scorekeeper.default_path, help="directory of the json scoreboards")
+    parser.add_argument("--database", default=SQLiteScorekeeper.default_path, help="SQLite database to import into")
+    parser.add_argument("--overwrite", action="store_true", help="replace boards that are already in the database")
+    args = parser.parse_args()
+
+    source = os.path.abspath(args.source)+"/"
+    scorekeeper = Scorekeeper(source)
+    database = SQLiteScorekeeper(os.path.abspath(args.database))
+
+    boards = {name: board for name, board in scorekeeper.scoreboards.items() if name not in scorekeeper.stale} #the json backend would throw the stale ones out at its next compaction anyway
+    imported = database.import_scoreboards(boards, overwrite=args.overwrite)
+    for name in sorted(scorekeeper.scoreboards):
+        entries = len([key for key in scorekeeper.scoreboards[name] if key != "__saved__"])
+        if name in scorekeeper.stale:
+            status = "skipped (old generation)"
+        else:
+            status = "imported" if name in imported else "skipped (already in the database)"
+        print("{:<30}{:>8} scores  {}".format(name, entries, status))
+    database.save(force_all=True)
+    database.close()
+    print("Imported {} of {} scoreboards into {}".format(len(imported), len(scorekeeper.scoreboards), args.database))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Optional worker pool for the CPU-heavy text analysis in on_message (keymash scoring, portmanteaus, typo injection).
+
+With ANALYSIS_WORKERS::0 (the default) everything runs inline on the event loop like it always has. With workers,
+big jobs go to a ProcessPoolExecutor so one long pasted message can't hold up voice packets or other guilds' commands.
+Requests are just a task name plus a tuple of plain strings/numbers (and results are just as small), so pickling them
+on the way to and from the workers stays cheap, and the workers never need any bot state. Randomness is passed in as a
+seed so the workers stay pure.
+
+Trigger matching stays on the event loop: the compiled rulesets are big, so shipping them to the workers
+(and keeping them in sync when the rule files change) would cost more than matching does.
+"""
+
+import time
+import random
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .keymash import keymash_test, keymash_test_many, load_model
+from .portmanteau import combine
+from .typos import add_typos
+
+log = logging.getLogger(__name__)
+
+OFFLOAD_MIN_CHARS = 256 #smaller jobs run inline, since the round-trip to a worker costs more than the work itself
+
+
+def _context():
+    """
+    The multiprocessing context for the workers. Not fork (the linux default): the bot already has threads running
+    (the scoreboard writer, OCR, discord's), and a forked child can get stuck on a lock one of them was holding.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _rng(seed):
+    return random if seed is None else random.Random(seed)
+
+
+def _keymash(text):
+    return keymash_test(text)
+
+
+def _keymash_many(texts):
+    return tuple(keymash_test_many(texts))
+
+
+def _portmanteau(words, excludes, seed):
+    return combine(words, excludes, _rng(seed))
+
+
+def _typos(texts, sloppiness, seed):
+    rng = _rng(seed)
+    return tuple(add_typos(text, sloppiness, rng) for text in texts)
+
+
+TASKS = {
+    "keymash": _keymash,            #(text) -> confidence from 0.0 to 1.0
+    "keymash_many": _keymash_many,  #(texts) -> confidences
+    "portmanteau": _portmanteau,    #(words, excludes, seed) -> (combo_word, delete_after) or None
+    "typos": _typos,                #(texts, sloppiness, seed) -> typoed texts
+}
+
+
+def run_task(name, args):
+    """
+    Runs one request. This is what the workers call.
+    """
+    return TASKS[name](*args)
+
+
+def run_timed(name, args):
+    """
+    run_task, plus how many seconds the task itself took (timed wherever it ran, so waiting for a worker doesn't count).
+    """
+    start = time.perf_counter()
+    result = run_task(name, args)
+    return result, time.perf_counter()-start
+
+
+def _size(args):
+    """
+    Rough cost of a request: the number of characters in its arguments.
+    """
+    size = 0
+    for arg in args:
+        if isinstance(arg, str):
+            size += len(arg)
+        elif isinstance(arg, tuple):
+            size += _size(arg)
+    return size
+
+
+class AnalysisPool:
+    """
+    Dispatches analysis requests inline or to worker processes, and keeps track of the per-message latency budget.
+    """
+
+    def __init__(self, workers=0, budget=0):
+        """
+        workers is the number of worker processes (0 runs everything inline).
+        budget is how many seconds a message gets before optional responders are skipped (0 means no limit).
+        """
+        self.workers = workers
+        self.budget = budget
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=_context(), initializer=load_model) if workers > 0 else None #each worker loads its own keymash model up front
+
+    def seed(self):
+        """
+        A seed for a request's RNG. None (use the global RNG) when running inline, so nothing changes without workers.
+        """
+        return None if self.executor is None else random.getrandbits(32)
+
+    def remaining(self, started):
+        """
+        Seconds left in the budget of a message that started at started (a time.perf_counter() value), or None if there's no budget.
+        """
+        if self.budget <= 0:
+            return None
+        return self.budget - (time.perf_counter()-started)
+
+    def over_budget(self, started):
+        remaining = self.remaining(started)
+        return remaining is not None and remaining <= 0
+
+    async def run(self, name, *args):
+        """
+        Runs a request and returns its result. Exceptions are raised like normal.
+        """
+        if self.executor is None or _size(args) < OFFLOAD_MIN_CHARS:
+            return run_task(name, args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, run_task, name, args)
+
+    async def run_optional(self, jobs, started, timings=None):
+        """
+        Runs a dict of {name: (task, args)} for optional responders side by side, within the budget of a message that started at started.
+        Returns {name: result} for the jobs that finished in time. A job that raised maps to its exception instead.
+        Jobs that didn't make it are just left out.
+        If timings is a dict, it gets {name: seconds} for every job that finished without raising (see run_timed).
+        """
+        results = {}
+        pending = {}
+        for name, (task, args) in jobs.items():
+            if self.over_budget(started):
+                break
+            if self.executor is None or _size(args) < OFFLOAD_MIN_CHARS:
+                try:
+                    results[name], seconds = run_timed(task, args)
+                except Exception as e:
+                    results[name] = e
+                    continue
+                if timings is not None:
+                    timings[name] = seconds
+            else:
+                pending[name] = asyncio.get_running_loop().run_in_executor(self.executor, run_timed, task, args)
+
+        if pending:
+            remaining = self.remaining(started)
+            await asyncio.wait(pending.values(), timeout=None if remaining is None else max(remaining, 0))
+            for name, future in pending.items():
+                if not future.done():
+                    future.cancel() #the worker finishes it anyway, but nobody is waiting on the result
+                    log.debug("Skipped the {} responder, it went over the {}s budget".format(name, self.budget))
+                elif future.exception() is not None:
+                    results[name] = future.exception()
+                else:
+                    results[name], seconds = future.result()
+                    if timings is not None:
+                        timings[name] = seconds
+        return results
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,256 @@
+from collections.abc import MutableMapping
+
+import numpy as np
+
+class ArrayBoard(MutableMapping):
+
+    """==========================================================================
+    A compact scoreboard for Scorekeeper(compact=True). Acts like the usual dict of "user id": score,
+    but user ids and numeric scores live in parallel NumPy arrays (int64 ids, float64 scores, and a flag for which
+    scores were ints so they come back as ints), found through an open-addressing hash table that's also just an array.
+    On a 200k-score board that measured about 33 bytes a score (hash table included), against about 137 for a dict.
+    Anything that doesn't fit (keys that aren't plain user ids, scores that aren't numbers, __saved__) goes in a normal dict on the side.
+    It also stands in for the board's LeaderboardIndex: top(), rank_of(), leaders() and total() are all done with NumPy.
+    =============================================================================
+    """
+
+    EMPTY = 0       #table values are slot+1, so 0 can mean empty
+    DELETED = -1
+    MAX_EXACT = 2**53 #bigger ints than this can't round-trip through a float64
+
+    def __init__(self, contents={}):
+        self.ids = np.zeros(8, dtype=np.int64)
+        self.scores = np.zeros(8, dtype=np.float64)
+        self.is_int = np.zeros(8, dtype=bool)
+        self.size = 0
+        self.table = np.zeros(16, dtype=np.int32)
+        self.used = 0           #table cells that aren't EMPTY (tombstones count, they slow down lookups too)
+        self.extra = {}         #everything that doesn't fit in the arrays
+        self.version = 0        #bumped on every change, so leaders() knows when to recompute
+        self.leader_cache = None
+        self.update(contents)
+
+    @staticmethod
+    def _as_id(key):
+        """
+        The int64 id for a key that's a plain non-negative integer string, otherwise None.
+        """
+        if type(key) is not str or not key.isdigit() or not key.isascii() or (len(key) > 1 and key[0] == "0") or len(key) > 19:
+            return None
+        number = int(key)
+        return number if number < 2**63 else None
+
+    @classmethod
+    def _fits(cls, value):
+        return type(value) is float or (type(value) is int and -cls.MAX_EXACT <= value <= cls.MAX_EXACT)
+
+    def _cell(self, number):
+        return ((number * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (64 - (len(self.table).bit_length() - 1))
+
+    def _find(self, number):
+        """
+        The (table cell, slot) of an id. The slot is -1 if it isn't there, and the cell is then where it would go.
+        """
+        mask = len(self.table) - 1
+        cell = self._cell(number)
+        free = -1
+        while True:
+            entry = int(self.table[cell])
+            if entry == self.EMPTY:
+                return (cell if free < 0 else free), -1
+            if entry == self.DELETED:
+                if free < 0:
+                    free = cell
+            elif int(self.ids[entry-1]) == number:
+                return cell, entry-1
+            cell = (cell + 1) & mask
+
+    def _rehash(self, table_size):
+        self.table = np.zeros(table_size, dtype=np.int32)
+        self.used = 0
+        for slot in range(self.size):
+            cell, _ = self._find(int(self.ids[slot]))
+            self.table[cell] = slot + 1
+            self.used += 1
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        for name in ("ids", "scores", "is_int"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def __getitem__(self, key):
+        number = self._as_id(key)
+        if number is not None:
+            _, slot = self._find(number)
+            if slot >= 0:
+                return int(self.scores[slot]) if self.is_int[slot] else float(self.scores[slot])
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        self.version += 1
+        number = self._as_id(key)
+        if number is None:
+            self.extra[key] = value
+            return
+        if not self._fits(value):
+            self._delete_number(number)
+            self.extra[key] = value
+            return
+        self.extra.pop(key, None)
+        cell, slot = self._find(number)
+        if slot < 0:
+            if self.size == len(self.ids):
+                self._grow()
+            slot = self.size
+            self.size += 1
+            self.ids[slot] = number
+            if int(self.table[cell]) == self.EMPTY:
+                self.used += 1
+            self.table[cell] = slot + 1
+            if self.used * 2 > len(self.table):
+                self._rehash(len(self.table) * 2 if self.size * 4 > len(self.table) else len(self.table)) #just clears the tombstones out if it's not actually full
+        self.scores[slot] = value
+        self.is_int[slot] = type(value) is int
+
+    def _delete_number(self, number):
+        """
+        Takes an id out of the arrays (if it's there) by moving the last entry into its slot. Returns True if it was there.
+        """
+        cell, slot = self._find(number)
+        if slot < 0:
+            return False
+        self.table[cell] = self.DELETED
+        last = self.size - 1
+        if slot != last:
+            moved_cell, _ = self._find(int(self.ids[last]))
+            self.ids[slot] = self.ids[last]
+            self.scores[slot] = self.scores[last]
+            self.is_int[slot] = self.is_int[last]
+            self.table[moved_cell] = slot + 1
+        self.size = last
+        return True
+
+    def __delitem__(self, key):
+        self.version += 1
+        number = self._as_id(key)
+        if number is not None and self._delete_number(number):
+            return
+        del self.extra[key]
+
+    def __contains__(self, key):
+        number = self._as_id(key)
+        if number is not None and self._find(number)[1] >= 0:
+            return True
+        return key in self.extra
+
+    def __iter__(self):
+        for number in self.ids[:self.size].tolist():
+            yield str(number)
+        yield from list(self.extra)
+
+    def __len__(self):
+        return self.size + len(self.extra)
+
+    def items(self):
+        """
+        Faster than going through __getitem__ for every key.
+        """
+        scores = [int(score) if is_int else score for score, is_int in zip(self.scores[:self.size].tolist(), self.is_int[:self.size].tolist())]
+        return list(zip(map(str, self.ids[:self.size].tolist()), scores)) + list(self.extra.items())
+
+    def clear(self):
+        self.__init__()
+
+    def copy(self):
+        """
+        A snapshot that can be read on another thread while this one keeps changing.
+        """
+        board = ArrayBoard.__new__(ArrayBoard)
+        board.ids, board.scores, board.is_int = self.ids.copy(), self.scores.copy(), self.is_int.copy()
+        board.size = self.size
+        board.table, board.used = self.table.copy(), self.used
+        board.extra = dict(self.extra)
+        board.version, board.leader_cache = self.version, None
+        return board
+
+    def nbytes(self):
+        """
+        Roughly how much memory the arrays take (not counting extra).
+        """
+        return self.ids.nbytes + self.scores.nbytes + self.is_int.nbytes + self.table.nbytes
+
+    #LeaderboardIndex stand-ins, so Scorekeeper can use the board itself as its index
+
+    def _ranked_extra(self):
+        return [(key, value) for key, value in self.extra.items() if key != "__saved__" and isinstance(value, (int, float))]
+
+    def _value(self, slot):
+        return int(self.scores[slot]) if self.is_int[slot] else float(self.scores[slot])
+
+    def top(self, k, filter=None):
+        """
+        The k best (key, score)s, best first. Ties go by id. If filter is given, only keys where filter(key) is true count.
+        """
+        if k <= 0:
+            return []
+        scores = self.scores[:self.size]
+        if filter is None and k < self.size:
+            threshold = np.partition(scores, self.size-k)[self.size-k] #the kth best score
+            candidates = np.flatnonzero(scores >= threshold)
+        else:
+            candidates = np.arange(self.size)
+        order = candidates[np.lexsort((self.ids[candidates], -scores[candidates]))]
+        found = []
+        extra = sorted(self._ranked_extra(), key=lambda item: -item[1])
+        e = 0
+        for slot in order.tolist():
+            key, score = str(int(self.ids[slot])), self._value(slot)
+            while e < len(extra) and extra[e][1] > score and len(found) < k:
+                if filter is None or filter(extra[e][0]):
+                    found.append(extra[e])
+                e += 1
+            if len(found) >= k:
+                break
+            if filter is None or filter(key):
+                found.append((key, score))
+        while e < len(extra) and len(found) < k:
+            if filter is None or filter(extra[e][0]):
+                found.append(extra[e])
+            e += 1
+        return found[:k]
+
+    def rank_of(self, score):
+        """
+        The rank a score would have: 1 plus the number of strictly better scores (so ties share a rank).
+        """
+        better = int(np.count_nonzero(self.scores[:self.size] > score))
+        return better + sum(1 for _, value in self._ranked_extra() if value > score) + 1
+
+    def leaders(self):
+        """
+        The keys tied for the top score, as a frozenset. Nobody leads with a score of 0. Remembered until the board changes.
+        """
+        if self.leader_cache is None or self.leader_cache[0] != self.version:
+            extra = self._ranked_extra()
+            best = max([value for _, value in extra], default=None)
+            if self.size:
+                array_best = self.scores[:self.size].max()
+                best = array_best if best is None else max(best, array_best)
+            leaders = frozenset()
+            if best is not None and best != 0:
+                leaders = frozenset(str(number) for number in self.ids[:self.size][self.scores[:self.size] == best].tolist())
+                leaders |= frozenset(key for key, value in extra if value == best)
+            self.leader_cache = (self.version, leaders)
+        return self.leader_cache[1]
+
+    def total(self):
+        """
+        The sum of every numeric score.
+        """
+        extra = self._ranked_extra()
+        if self.is_int[:self.size].all() and all(type(value) is int for _, value in extra):
+            return int(self.scores[:self.size].astype(np.int64).sum()) + sum(value for _, value in extra)
+        return float(self.scores[:self.size].sum()) + sum(value for _, value in extra)
@@ -42,11 +42,19 @@ from .opus_loader import load_opus_lib
 from .config import Config, ConfigDefaults
 from .permissions import Permissions, PermissionsDefaults
 from .aliases import Aliases, AliasesDefault
-from .constructs import SkipState, Response
-from .utils import load_file, write_file, fixg, ftimedelta, _func_, _get_variable
+from .constructs import SkipState, Response, StageTimer
+from .utils import load_file, write_file, fixg, ftimedelta, merge_segments, _func_, _get_variable
 from .spotify import Spotify
 from .json import Json
 from .scorekeeper import Scorekeeper
+from .sqlite_scorekeeper import SQLiteScorekeeper
+from .keywords import RuleStore, MessageContext
+from .typos import add_typos
+from .keymash import load_model as load_keymash_model
+from .portmanteau import portmanteau
+from .analysis import AnalysisPool
+from .ocr import OCRService
+from .ocr_cache import OCRCache
 
 from .constants import VERSION as BOTVERSION
 from .constants import DISCORD_MSG_CHAR_LIMIT, AUDIO_CACHE_PATH
@@ -61,7 +69,9 @@ load_opus_lib()
 log = logging.getLogger(__name__)
 
 class MusicBot(discord.Client):
-            
+
+    OCR_CACHE_SAVE_INTERVAL = 60 #seconds between saves of the OCR cache (it's also saved on shutdown)
+
     def __init__(self, config_file=None, perms_file=None, aliases_file=None):
         try:
             sys.stdout.write("\x1b]2;MusicBot {}\x07".format(BOTVERSION))
@@ -82,7 +92,16 @@ class MusicBot(discord.Client):
         self.load_configs() #loads the custom configs. TODO -- can this be moved to the config.py file and integrated into the existing config parser?
         self.set_secret_word()
         self.next_reminder = self.get_next_reminder()
-        self.scorekeeper = Scorekeeper()
+        self.scorekeeper = SQLiteScorekeeper() if self.scoreboard_backend=="sqlite" else Scorekeeper(compact=self.compact_scoreboards)
+        self.scorekeeper.start_writer(self.scoreboard_save_interval) #scoreboards get saved on their own thread from now on
+        self.rule_store = RuleStore()
+        self.stage_timer = StageTimer() #disabled unless something (like benchmarks/on_message_bench.py) turns it on
+        load_keymash_model() #loaded once up front (analysis workers load their own when they start)
+        self.analysis_pool = AnalysisPool(self.analysis_workers, self.analysis_budget) #changing ANALYSIS_WORKERS needs a restart
+        self.fetched_users = {} #users get_user_cached had to fetch, oldest first
+        self.background_tasks = set() #fire-and-forget tasks (like the image pass of on_message), kept here so they can't get garbage collected halfway through
+        self.ocr = OCRService(cache=OCRCache())
+        self.ocr_cache_saved_at = time.monotonic() #the OCR cache gets saved at most once every OCR_CACHE_SAVE_INTERVAL seconds
         self.days_until_reboot = random.randint(5,10)
         print("Days until reboot: "+str(self.days_until_reboot))
 
@@ -920,6 +939,11 @@ class MusicBot(discord.Client):
     # 2023-04-22: Hacked this in to see if I can close the session properly.
     async def close(self):
         print("hi")
+        self.analysis_pool.shutdown()
+        self.ocr.close()
+        if not self.ocr.cache.is_saved:
+            await asyncio.to_thread(self.ocr.cache.write, self.ocr.cache.snapshot())
+        await asyncio.to_thread(self.scorekeeper.stop_writer) #last save
         await self.aiosession.close()
         await super().close()
 
@@ -1001,6 +1025,9 @@ class MusicBot(discord.Client):
             log.debug("Received additional READY event, may have failed to resume")
             return
 
+        for guild in self.guilds: #build the guild leaderboard groups once. After this, the member/guild events keep them up to date
+            self.scorekeeper.set_group(guild.id, [member.id for member in guild.members])
+
         await self._on_ready_sanity_checks()
 
         self.init_ok = True
@@ -2897,70 +2924,6 @@ class MusicBot(discord.Client):
         return
 
 
-    def keymash_test(self,input_text):
-        """
-        Runs two tests to determine how confident the bot is that an input string is keymashing.
-        Outputs a value from 0.0 to 1.0, where 1.0 is 100% confidence the input is keymashing.
-        """
-        characters = "abcdefghijklmnopqrstuvwxyz. "
-        def get_number(text):
-            number = 0
-            for i in range(0,len(text)):
-                number *= len(characters)
-                number += characters.find(text[i])
-            return number
-
-        def chi_squared(o,e):
-            sum = 0
-            for i in range(0,len(o)):
-                sum += ((o[i]-e[i])**2)/max(e[i],0.00001)
-            return sum
-
-        def get_list(text):
-            text = text.lower()
-            list = []
-            singles = len(characters)
-            doubles = len(characters)**2
-            for i in range (0, singles+doubles):
-                list.append(0)
-            length = len(text)
-    
-            for i in range(0,length):
-                f = text[i]
-                s = text[min(i+1,length-1)]
-
-                f = " " if not f in characters else f
-                s = " " if not s in characters else s
-
-                single = get_number(f)
-                double = get_number(f+s)
-                list[single] += 1
-                if i<=length-2:
-                    list[double+singles] += 1
-            for i in range(0,len(list)):
-                list[i] /= length
-            return list
-
-        def test_input(input_list, data_list, text_length):
-            return chi_squared(input_list, data_list)/text_length
-
-        #save memory by re-using the same lists for both tests
-        data_list = []
-        input_list = get_list(input_text)
-
-        with open(os.path.abspath("keymash_data/data_eng.txt"),"r") as f:
-            for line in f.readlines():
-                data_list.append(float(line))
-        eng_score = test_input(input_list, data_list, len(input_text))
-
-        with open(os.path.abspath("keymash_data/data_kma.txt"),"r") as f:
-            lines = f.readlines()
-            for i in range(0,len(lines)):
-                data_list[i]=float(lines[i])
-        kma_score = test_input(input_list, data_list, len(input_text))
-
-        return (eng_score/(eng_score+kma_score))
-
     def scramble(self, input):
         """
         Returns a scrambled version of input.
@@ -2974,72 +2937,21 @@ class MusicBot(discord.Client):
 
     def add_typos(self, input):
         """
-        Inserts realistic typos into an input string. 
+        Inserts realistic typos into an input string, based on the sloppiness multiplier (see musicbot/typos.py).
         Does its best not to affect newlines and anything inside curly-braces (i.e. won't break response tags)
         """
-        keyboard = ["qwertyuiop[","aasdfghjkl;","zzxcvbnm,./"] #approximation of a qwerty-keyboard layout
-        output = ""
-        inkey = False #used to prevent the typos from affecting any keys that may have made it this far
-        for i in range(len(input)):
-            letter = input[i]
-            if letter=="{":
-                inkey=True
-            if len(output)>0 and output[-1]=="}":
-                inkey=False
-            if not letter in "\n" and any(letter in bar for bar in keyboard) and not inkey: #don't fuck with newlines or extra characters or keys
-                while True:
-                    if random.random()>=self.sloppiness_multiplier or self.sloppiness_multiplier>=1: #keep looping until this is true
-                        break
-                    y = 0 if letter in keyboard[0] else (1 if letter in keyboard[1] else 2)
-                    x = keyboard[y].index(letter)
-                    if random.random()<=0.5:
-                        x += random.randint(-1,1)
-                    else:
-                        y += random.randint(-1,1)
-                    y = max(0,min(y,2))
-                    x = max(0,min(x,len(keyboard[y])-1))
-                    letter = keyboard[y][x] if not keyboard[y][x]=="}" else "" #just in case
-            elif not inkey and letter=="!" and random.random()<=self.sloppiness_multiplier:
-                letter="1"
-            elif not inkey and letter==" " and random.random()<=self.sloppiness_multiplier:
-                letter = random.choice(["","  "])
-            output+=letter
-        return output + ("'" if random.random()<=self.sloppiness_multiplier else "") #sometimes add an apostrophe to the end because of a missed return key
+        return add_typos(input, self.sloppiness_multiplier)
                     
 
-    #parses the trailing and leading phrases from a message around a given keyword. Returns response with the {trail} and {lead} tags filled in
-    def insert_trailing_and_leading(self, message, keyword, response):
-
-        split_characters = ".!?" #characters that mark the edges of the trailing/leading text
-
-        if "{trail}" in response or "{trail1}" in response:
-            trailing = message.split(keyword)[1]
-            for i in range(len(split_characters)):
-                trailing = trailing.split(split_characters[i])[0]
-            if trailing:
-               response = response.replace("{trail}",trailing.strip())
-               response = response.replace("{trail1}", trailing.strip().split(" ")[0])
-
-        if "{lead}" in response or "{lead1}" in response:
-            leading = message.split(keyword)[0]
-            for i in range(len(split_characters)):
-                leading = leading.split(split_characters[i])[-1]
-            if leading:
-                response = response.replace("{lead}",leading.strip())
-                response = response.replace("{lead1}", leading.strip().split(" ")[-1])
-
-        return response
-
-    #tells you if a key in a given message is "alone" (not a part of any other words)
-    def key_is_alone(selfd,message,key):
-        break_characters = ".!?,;:\"'"
-        for i in range(len(break_characters)): #remove common punctuation
-            message = message.replace(break_characters[i]," ")
-            key = key.replace(break_characters[i]," ")
-
-        if len(key.split(" "))==1: #simplest case - key is one word long
-            return (key in message.split(" "))
-        return (message==key or message.startswith(key+" ") or message.endswith(" "+key) or (" "+key+" ") in message) #all the situations I can think of where key is alone
+    #parses the trailing and leading phrases from a message around a given keyword. Returns them as a (trailing, leading) tuple of unstripped strings
+    def get_trailing_and_leading(self, message, keyword):
+        if not keyword:
+            return ("", "")
+        leading, _, trailing = message.partition(keyword)
+        trailing = trailing.partition(keyword)[0]
+        trailing = re.split(r"[.!?]", trailing, 1)[0] #".!?" mark the edges of the trailing/leading text
+        leading = re.split(r"[.!?]", leading)[-1]
+        return (trailing, leading)
 
     #converts an input string into a mocking tone by alternating upper and lowercase characters
     def mocking_tone(self,text):
@@ -3077,6 +2989,48 @@ class MusicBot(discord.Client):
             output_list.append(r)
         return output_list
 
+    async def read_image_attachments(self, message):
+        """
+        Returns the raw bytes of every image attached to message (for OCR). They never touch the disk.
+        """
+        image_types = ["png","jpeg","gif","jpg"]
+        images = []
+        for attachment in message.attachments:
+            if any(attachment.filename.lower().endswith(image) for image in image_types):
+                try:
+                    images.append(await attachment.read())
+                except discord.HTTPException:
+                    pass
+        return images
+
+    async def deliver_responses(self, message, responses, reactions):
+        """
+        Sends the keyword responses for a message and adds its reactions.
+        {break} segments and whole responses that delete at the same time get merged into as few messages as possible.
+        Messages and reactions use different rate limit buckets, so the two go out side by side. Within each one things
+        still go out in order so the responses read right and the reactions show up in the order they were written.
+        """
+        segments = []
+        for response in responses:
+            for text in response["text"].split("{break}"):
+                segments.append((text, response["delete_after"]))
+
+        async def send_all():
+            for text, delete_after in merge_segments(segments):
+                if delete_after < 0:
+                    await message.channel.send(text)
+                else:
+                    await message.channel.send(text, delete_after=delete_after)
+
+        async def react_all():
+            for emoji in reactions:
+                try:
+                    await message.add_reaction(emoji)
+                except discord.HTTPException:
+                    log.warning("Could not react with {} (bad emoji in a response?)".format(emoji))
+
+        await asyncio.gather(send_all(), react_all())
+
     #extracts the urls from an input string. there's probably many edge cases that aren't considered here
     def extract_urls(self, input):
         split = input.split(" ")
@@ -3087,310 +3041,231 @@ class MusicBot(discord.Client):
         return urls
 
 
-    def portmanteau(self, first, second):
-        """combines two words into one word - written by Katie"""
+    async def respond_to_keywords(self, message, context, from_image=False, skip_rules=frozenset(), timer=None):
+        """
+        Matches a message's text (a MessageContext) against the keyword rules and sends the responses.
+        from_image means the text includes text read from images, so {noimg} keys get skipped.
+        Rules whose lines are in skip_rules are ignored (they already had their shot at this message).
+        Returns (number of responses sent, set of the lines of the rules that matched).
+        """
+        message_content = context.content
+        timer = timer if timer else StageTimer() #a disabled one if nobody is timing this
+        pool = self.analysis_pool
+        is_private = isinstance(message.channel, discord.abc.PrivateChannel)
 
-        leading_vowel = re.compile(r'^[aeiou]', re.IGNORECASE)
-        pattern = re.compile(r'(\w*?)([aeiou]\w*)', re.IGNORECASE)
-        
-        # Error check: The function won't take words that are too short (1 letter).
-        if (len(first) < 2 or len(second) < 2):
-            #print("Arguments not long enough!")
-            return ""
-                               
-        # Error check: The first word can't start with a vowel.
-        if (leading_vowel.match(first)):
-            #print("First word can't start with vowel!")
-            return ""
-                                                  
-        # Error check: Both words must actually have vowels in them for this to actually work.
-        if not (pattern.match(first) and pattern.match(second)):
-            #print("No vowels found!")
-            return ""
-                                                                            
-        port = pattern.match(first).group(1)
-        manteau = pattern.match(second).group(2)
-                                                                                    
-        return (port + manteau)
-        #combines two words into one word
-
-    def portmanteau_old(first, second):
-        """Older version of portmanteau - Ignores the letter Y. Raises exceptions instead of returning empty string"""
-        leading_vowel = re.compile(r'^[aeiou]', re.IGNORECASE)
-        pattern = re.compile(r'(\w+?)([aeiou]\w*)', re.IGNORECASE)
-        if (len(first) < 2 or len(second) < 2):
-            return None
-        if (leading_vowel.match(first)):
-            return None
-        if not (pattern.match(first) and pattern.match(second)):
-            return None
-        port = pattern.match(first).group(1)
-        manteau = pattern.match(second).group(2)
-        return (port + manteau)
-        
-    def portmanthree(self, first, second, third):
-        """Combines two of three words using the portmanteau method - Written by Kate"""
-        options = []
-        words = [first,second,third]
-        try:
-            port12 = self.portmanteau(first,second)
-            if not port12 in words and port12.strip() and not any(((pair.split(";;",1)[0]==words[0].lower() or pair.split(";;",1)[0]=="*") and (pair.split(";;",1)[1]==words[1].lower() or pair.split(";;",1)[1]=="*")) for pair in self.portmanteau_excludes):
-                options.append(port12+" "+third)
-        except (AttributeError,IndexError):
-            print("There was an error in portmanthree on 23 of: "+" ".join(words))
-        
-        try:
-            port23 = self.portmanteau(second,third)
-            if not port23 in words and port23.strip() and not any(((pair.split(";;",1)[0]==words[1].lower() or pair.split(";;",1)[0]=="*") and (pair.split(";;",1)[1]==words[2].lower() or pair.split(";;",1)[1]=="*")) for pair in self.portmanteau_excludes):
-                options.append(first+" "+port23)
-        except (AttributeError,IndexError):
-            print("There was an error in portmanthree on 23 of: "+" ".join(words))
-
-        #These are options I decided to leave out
-        #options.append(portmanteau(first,portmanteau(second,third)))
-        #options.append(portmanteau(portmanteau(first,second),third))
-
-        if len(options)>0:
-            return random.choice(options)
-        return None
+        #keyword recognition stuff
+        guild_id = None if is_private else message.channel.guild.id
+        ruleset = self.rule_store.ruleset_for(guild_id) #TODO - make this server-specific and configurable (guild rulesets are cached, so this is just a matter of which files go into them)
 
+        contains_only = False
+        cleaned_message = context.cleaned #lowered with some punctuation removed. Key and response tags are already pulled out by the ruleset
+        timer.lap("rules")
 
-    async def on_message(self, message):    #The big one. Processes all incoming messages.
-        await self.wait_until_ready()
-        message_content = message.content.strip()
-        message_content = message_content.replace(self.config.command_prefix+"am i goku", self.config.command_prefix+"goku") #for annie
+        response_cache = []          #contains all responses to be sent - dicts of {"text", "delete_after", "always", "only"} (delete_after of -1 means no deletion)
+        reactions = []               #emojis to react to the message with
+        matched_rules = set()        #lines of the rules that got a shot at responding (whether or not they made it through)
 
-        reference_dict = self.replies_to_whisper(message) #check if the message is a reply to a whisper. If so, we will skip all the keyword/portmanteau stuff
+        for rule, matched_keys in ruleset.match(cleaned_message): #only the rules with a key somewhere in the message
 
-        if message_content != None and message.author != self.user and not message.content.startswith(self.config.command_prefix) and not message.author.id in self.blacklist and (isinstance(message.channel, discord.abc.PrivateChannel) or not any(gid==message.guild.id for gid in self.unfun_guilds)) and not reference_dict:
-            
-            #portmanteau stuff
-            words = message_content.split()
-            if ((len(words)==2 or len(words)==3) and not message_content.startswith(self.config.command_prefix)):
-                if not any(((pair.split(";;",1)[0]==words[0].lower() or pair.split(";;",1)[0]=="*") and (pair.split(";;",1)[1]==words[1].lower() or pair.split(";;",1)[1]=="*")) for pair in self.portmanteau_excludes) or len(words)==3: #Excludes are applied to portmanthrees in the portmanthree method
-                    try:
-                        if len(words)==2: #portmanteau
-                            combo_word = self.portmanteau(words[0], words[1])
-                            if not (combo_word == words[0] or combo_word == words[1]) and combo_word.strip():
-                                own_message = await message.channel.send(combo_word, delete_after=15)
-                                await own_message.add_reaction("\U0001F4BE")
-
-                        if len(words)==3 and random.random()<0.5: #portmanthree  - only 50% chance so it's less spammy
-                            combo_word = self.portmanthree(words[0], words[1], words[2])
-                            if combo_word:
-                                own_message = await message.channel.send(combo_word, delete_after=10)
-                                await own_message.add_reaction("\U0001F4BE")
-                    except AttributeError:
-                        print("Portmanteau threw an AttributeError for "+message_content)
-                        with open(os.path.abspath("portmanteau_fails.txt"),"a") as f:
-                            f.write("Attribute Error: "+message_content+"\n")
-                    except IndexError:
-                        print("Portmanteau threw an IndexError for "+message_content)
-                        with open(os.path.abspath("portmanteau_fails.txt"),"a") as f:
-                            f.write("Index Error: "+message_content+"\n")
-
-            #keymash recognition stuff
-            if len(message_content)>=11 and not message_content.startswith(self.config.command_prefix) and not message.author==self.user and not "goku" in message_content.lower():
-                keymash_confidence = self.keymash_test(message_content)
-                if keymash_confidence > 0.85:
-                        await message.channel.send(self.scramble(message_content.replace(" ","")),delete_after=20)
-
-            #image reading stuff
-            from_image = False #used for certain response tags
-            if not isinstance(message.channel, discord.abc.PrivateChannel):
-                image_types = ["png","jpeg","gif","jpg"]
-                cached_images = []
-                for attachment in message.attachments:
-                    if any(attachment.filename.lower().endswith(image) for image in image_types):
-                        try:
-                            await attachment.save(os.path.abspath("image_cache/"+attachment.filename))
-                            cached_images.append(os.path.abspath("image_cache/"+attachment.filename))
-                        except:
-                            pass
-
-                if len(cached_images)>0:
-                    hash_code = str(message.id) #prevents race conditions and stuff
-                    with open(os.path.abspath("image_cache/image_list"+hash_code+".txt"),"w") as f:
-                        for path in cached_images:
-                            f.write(path)
-                            f.write("\n")
-                    await self.run_cli("tesseract "+os.path.abspath("image_cache/image_list"+hash_code+".txt")+" "+os.path.abspath("image_cache/out"+hash_code)) #run tesseract
-                    with open(os.path.abspath("image_cache/out"+hash_code+".txt"),"r") as f:
-                        message_content += f.read().strip()
-                        from_image = True
-                    for path in cached_images:
-                        await self.run_cli("rm "+path)
-                    await self.run_cli("rm "+os.path.abspath("image_cache/image_list"+hash_code+".txt"))
-
-            #start_time = time.time()
-
-            #keyword recognition stuff
-            with open(os.path.abspath("responses.txt"),'r') as f: #TODO - make this server-specific and configurable
-                lines = f.readlines()
+            if rule.line in skip_rules:
+                continue
 
-            with open(os.path.abspath("emotes/default.txt"),'r') as f: #TODO - make this server-specific and configurable
-                lines.extend(f.readlines())
-            try:
-                with open(os.path.abspath("emotes/{}.txt".format(message.channel.guild.id)),'r') as f:
-                    lines.extend(f.readlines())
-            except:
-                pass
+            for key in matched_keys:
 
-            #read_time = round(time.time() - start_time,4)
-            #start_time = time.time()
+                if key.alone and not context.key_is_alone(key):
+                    continue
 
-            #tags to remove from the message, keys, and responses when cleaning
-            cleaning_tags_message = [",","’","'","\""]
-            cleaning_tags_key = ["{noimg}","{deleteorig}","{jeff}","{nodel}","{only}","{a}","{alone}","{gokuattempt}","{fast}","{vfast}","{rare}","{vrare}"]
-            cleaning_tags_response = ["{nodel}","{deleteorig}","{goku}","{fast}","{vfast}","{rare}","{vrare}"]
+                if not (from_image and key.noimg) and (not key.jeff or message.author.id == 0000000):
 
-            contains_only = False
+                    matched_rules.add(rule.line)
+                    template = random.choice(rule.responses)
 
-            cleaned_message = message_content.lower().strip()
-            message_words = cleaned_message.split(" ")
-            for tag in cleaning_tags_message:
-                cleaned_message = cleaned_message.replace(tag,"")
+                    #boolean-like tags
+                    deleteorig = key.deleteorig or template.deleteorig
+                    nodel = key.nodel or template.nodel
+                    fast_delete = key.fast or template.fast
+                    vfast_delete = key.vfast or template.vfast
+                    if (key.rare or template.rare) and random.random()>=0.5:
+                        continue
+                    if (key.vrare or template.vrare) and random.random()>=0.1:
+                        continue
 
-            response_cache = []          #contains all responses to be sent
-            delete_flags_cache = []      #contains the time until deletion of the corresponding response (-1 indicated no deletion)
-            #^^(these should be replaced by a single dict list)
+                    only = key.only or template.only
+                    if only:
+                        contains_only = True
 
-            for line in lines:
+                    if key.gokuattempt:
+                        daily_attempts = self.changeScoreboard(message.author.id, "goku_attempts") #the increment and read are one step (one statement with the sqlite backend), so attempts can't get lost
+                        if daily_attempts>self.max_daily_gokus:
+                            await message.channel.send("YOU HAVE USED UP YOUR DAILY GOKU ATTEMPTS!",delete_after = 60)
+                            continue
 
-                if not line.strip() or line.startswith("##"):
-                    continue
-                keys = re.split(r"(?<!\\),",re.split(r"(?<!\\);",line)[0])
-                #keys = line.split(';',1)[0].split(',')
-                for key in keys:
+                    if template.goku:
+                        self.changeScoreboard(message.author.id, "goku")
+
+                    #madlib tags
+                    values = {}
+                    if template.placeholders:
+                        now = datetime.now()
+                        madlibs = {
+                            "author": lambda: message.author.name,
+                            "atauthor": lambda: message.author.mention,
+                            "time": lambda: now.strftime("%-I:%M %p"),
+                            "date": lambda: now.strftime("%B %-d, %Y"),
+                            "weekday": lambda: now.strftime("%A"),
+                            "random": lambda: random.choice(context.words),
+                        }
+                        for name in template.placeholders:
+                            if name in madlibs:
+                                values[name] = madlibs[name]()
+
+                    if template.needs_trail or template.needs_lead:
+                        trailing, leading = self.get_trailing_and_leading(cleaned_message, key.cleaned)
+                        if (template.needs_trail and not trailing) or (template.needs_lead and not leading): #ignore response when there is no trail or lead
+                            continue
+                        values["trail"] = trailing.strip()
+                        values["trail1"] = trailing.strip().split(" ")[0]
+                        values["lead"] = leading.strip()
+                        values["lead1"] = leading.strip().split(" ")[-1]
 
-                    key = key.replace("{emote}","{a}{noimg}{nodel}")
-                    cleaned_key = key.lower().strip()
-                    for tag in cleaning_tags_key:
-                        cleaned_key = cleaned_key.replace(tag,"")
+                    witty_response = template.render(values)
 
-                    if cleaned_key in cleaned_message:
-                        if "{alone}" in key and not self.key_is_alone(cleaned_message,cleaned_key): #cleaned_key in cleaned_message.split(" "):
+                    if deleteorig and not message_content.startswith(self.config.command_prefix):
+                        try:
+                            await message.delete() #might cause issues later on?
+                        except discord.Forbidden:
+                            print("Tried to delete a message but don't have permission: "+message_content)
                             continue
+                        except discord.NotFound: #already gone (the image pass runs well after the text pass, which might have deleted it)
+                            pass
 
-                        if not (from_image and "{noimg}" in key) and (not "{jeff}" in key or message.author.id == 0000000):
-
-                            #witty_response = random.choice(line.split(';')[1].split(','))
-                            witty_response = random.choice(re.split(r"(?<!\\),",re.split(r"(?<!\\);",line)[1])).replace("\\","")
-
-                            #madlib tags
-                            now = datetime.now()
-                            witty_response = witty_response.replace("{author}",message.author.name)
-                            witty_response = witty_response.replace("{atauthor}",message.author.mention)
-                            witty_response = witty_response.replace("{time}",now.strftime("%-I:%M %p"))
-                            witty_response = witty_response.replace("{date}",now.strftime("%B %-d, %Y"))
-                            witty_response = witty_response.replace("{weekday}",now.strftime("%A"))
-
-                            # random tag
-                            witty_response = witty_response.replace("{random}", random.choice(message_words))
-
-                            #boolean-like tags
-                            deleteorig = ("{deleteorig}" in key or "{deleteorig}" in witty_response)
-                            nodel = ("{nodel}" in key or "{nodel}" in witty_response)
-                            fast_delete = ("{fast}" in key or "{fast}" in witty_response)
-                            vfast_delete = ("{vfast}" in key or "{vfast}" in witty_response)
-                            if ("{rare}" in key or "{rare}" in witty_response) and random.random()>=0.5:
-                                continue
-                            if ("{vrare}" in key or "{vrare}" in witty_response) and random.random()>=0.1:
-                                continue
-
-                            if ("{only}" in key or "{only}" in witty_response):
-                                contains_only = True
-                                witty_response = witty_response + "{only}"
-                            if "{a}" in key:
-                                witty_response = witty_response + "{a}"
-
-                            if "{gokuattempt}" in key:
-                                daily_attempts = self.changeScoreboard(message.author.id, "goku_attempts") #TODO - figure out how to resolve this potential race condition
-                                if daily_attempts>self.max_daily_gokus:
-                                    await message.channel.send("YOU HAVE USED UP YOUR DAILY GOKU ATTEMPTS!",delete_after = 60)
-                                    continue
-
-                            if "{goku}" in witty_response:
-                                self.changeScoreboard(message.author.id, "goku")
+                    reactions.extend(template.reactions) #added all at once when everything gets sent
 
+                    if nodel:
+                        delete_after = -1
+                    elif vfast_delete:
+                        delete_after = 1
+                    elif fast_delete:
+                        delete_after = 5
+                    else:
+                        delete_after = 15
+                    response_cache.append({"text": witty_response, "delete_after": delete_after, "always": key.a or template.a, "only": only})
 
-                            for tag in cleaning_tags_response:
-                                witty_response = witty_response.replace(tag,"")
+                    break
+        timer.lap("matching")
+
+        #Postprocess response cache
+        response_count = len(response_cache)
+        typoable = [] #responses that are allowed to be typoed. They all go in one batch
+        for i in range(len(response_cache)-1,-1,-1):
+            response = response_cache[i]
+            if contains_only and not response["only"] and not response["always"]: #there's an {only} tag somewhere, so remove all nonessential responses
+                response_cache.pop(i)
+            elif not response["always"] and not response["only"] and (response_count>self.max_responses or random.random()>self.response_frequency): #prune out some nonessential responses
+                response_cache.pop(i)
+            elif not response["text"].replace("{break}","").replace("💩","").strip(): #remove blank messages (such as reaction-only responses). Also patch for pooper exploit.
+                response_cache.pop(i)
+            elif not response["always"] or response["only"]: #message is allowed to be typoed
+                typoable.append(response)
+        if typoable:
+            typoed = await pool.run("typos", tuple(response["text"] for response in typoable), self.sloppiness_multiplier, pool.seed())
+            for response, text in zip(typoable, typoed):
+                response["text"] = text
+        timer.lap("typos")
+
+        #Send cached responses
+        response_count = len(response_cache) #update count in case some were removed
+        await self.deliver_responses(message, response_cache, reactions)
+        timer.lap("sending")
+        return response_count, matched_rules
+
+    async def respond_to_images(self, message, message_content, skip_rules):
+        """
+        Second keyword pass for a message with images, run in the background so the text responses never wait on tesseract.
+        The image text gets added to the message text and matched again, skipping {noimg} keys and any rules
+        the first pass already matched (so nothing gets responded to twice).
+        """
+        try:
+            images = await self.read_image_attachments(message)
+            if len(images)==0:
+                return
+            image_text = await self.ocr.read(images, message.id) #None if the OCR queue is full or it took too long
+            if not image_text or not image_text.strip():
+                return
+            context = MessageContext(message_content+image_text.strip())
+            await self.respond_to_keywords(message, context, from_image=True, skip_rules=skip_rules)
+        except Exception:
+            log.error("Error while responding to the images in message {}".format(message.id), exc_info=True)
 
-                            try:
-                                witty_response = self.insert_trailing_and_leading(cleaned_message, cleaned_key, witty_response)
-                                if "{trail" in witty_response or "{lead" in witty_response: #ignore response when there is no trail or lead
-                                    continue
-                            except:
-                                #raise
-                                print("There was an issue with leading/trailing parsing")
-                                continue
-
-                            if deleteorig and not message_content.startswith(self.config.command_prefix):
-                                try:
-                                    await message.delete() #might cause issues later on?
-                                except Forbidden:
-                                    print("Tried to delete a message but don't have permission: "+message_content)
-                                    continue
+    async def on_message(self, message):    #The big one. Processes all incoming messages.
+        await self.wait_until_ready()
+        message_content = message.content.strip()
+        message_content = message_content.replace(self.config.command_prefix+"am i goku", self.config.command_prefix+"goku") #for annie
 
-                            reaction_emoji_data = self.get_response_reactions(witty_response)
-                            witty_response = reaction_emoji_data.pop(0) #grab cleaned response - i do it this way just to be confusing
-                            for emoji in reaction_emoji_data:
-                                await message.add_reaction(emoji)
+        is_private = isinstance(message.channel, discord.abc.PrivateChannel)
+        reference_dict = self.replies_to_whisper(message) if is_private else None #check if the message is a reply to a whisper (those only live in DMs). If so, we will skip all the keyword/portmanteau stuff
 
-                            #if not witty_response.strip().replace("{break}",""): #there's nothing left after all the tags are gone
-                                #continue
+        #cheapest checks first - most messages in unfun guilds or from the bot itself never get past these
+        if not (is_private or message.guild.id not in self.unfun_guilds) or message.author == self.user or message.author.id in self.blacklist:
+            chat_pipeline = False
+        else:
+            chat_pipeline = message_content != None and not message.content.startswith(self.config.command_prefix) and not reference_dict
 
-                            response_cache.append(witty_response)
-                            if nodel:
-                                delete_flags_cache.append(-1)
-                            elif vfast_delete:
-                                delete_flags_cache.append(1)
-                            elif fast_delete:
-                                delete_flags_cache.append(5)
-                            else:
-                                delete_flags_cache.append(15)
+        if chat_pipeline:
+            timer = self.stage_timer #per-stage timings for benchmarking. Does nothing unless enabled
+            timer.begin()
 
-                            break
-            #parse_time = time.time()-start_time
-            #start_time = time.time()
-
-            #Postprocess response cache
-            response_count = len(response_cache)
-            for i in range(len(response_cache)-1,-1,-1):
-                if contains_only and not "{only}" in response_cache[i] and not "{a}" in response_cache[i]: #there's an {only} tag somewhere, so remove all nonessential responses
-                    response_cache.pop(i)
-                    delete_flags_cache.pop(i)
-                elif not "{a}" in response_cache[i] and not "{only}" in response_cache[i] and (response_count>self.max_responses or random.random()>self.response_frequency): #prune out some nonessential responses
-                    response_cache.pop(i)
-                    delete_flags_cache.pop(i)
-                elif not response_cache[i].replace("{break}","").replace("{a}","").replace("{only}","").replace("💩","").strip(): #remove blank messages (such as reaction-only responses). Also patch for pooper exploit.
-                    response_cache.pop(i)
-                    delete_flags_cache.pop(i)
-                    continue
-                elif not "{a}" in response_cache[i] or "{only}" in response_cache[i]: #message is allowed to be typoed
-                    response_cache[i]=self.add_typos(response_cache[i])
-
-            #Send cached responses
-            response_count = len(response_cache) #update count in case some were removed
-            for i in range(len(response_cache)):
-                response_block = response_cache[i].replace("{a}","").replace("{only}","")
-                delete_time = delete_flags_cache[i]
-                for response in response_block.split("{break}"):
-                    if delete_time < 0:
-                        await message.channel.send(response)
-                    else:
-                        await message.channel.send(response, delete_after=delete_time)
+            started = time.perf_counter() #for the analysis budget - optional responders get skipped once a message has taken too long
+            pool = self.analysis_pool
+            context = MessageContext(message_content) #every form of the message text, computed only when something needs it
 
-            #send_time = round(time.time()-start_time,4)
-            #print(str(read_time)+"  "+str(parse_time)+"  "+str(send_time)+" : "+str(read_time+parse_time+send_time))
+            #portmanteau and keymash stuff. Both are optional, so they run side by side (in the analysis pool if there is one) and get dropped if they take too long
+            analysis_jobs = {}
+            words = context.tokens
+            if ((len(words)==2 or len(words)==3) and not message_content.startswith(self.config.command_prefix)):
+                analysis_jobs["portmanteau"] = ("portmanteau", (tuple(words), self.portmanteau_excludes, pool.seed()))
+            if len(message_content)>=11 and not message_content.startswith(self.config.command_prefix) and not message.author==self.user and not "goku" in context.lowered:
+                analysis_jobs["keymash"] = ("keymash", (message_content,))
+            job_times = {}
+            analysis = await pool.run_optional(analysis_jobs, started, job_times) if analysis_jobs else {}
+            for name, seconds in job_times.items():
+                timer.add(name, seconds) #portmanteau and keymash on their own (they might have run side by side in workers)
+
+            portmanteau_result = analysis.get("portmanteau")
+            if isinstance(portmanteau_result, (AttributeError, IndexError)):
+                print("Portmanteau threw an {} for {}".format(type(portmanteau_result).__name__, message_content))
+                with open(os.path.abspath("portmanteau_fails.txt"),"a") as f:
+                    f.write("{}: {}\n".format(type(portmanteau_result).__name__, message_content))
+            elif isinstance(portmanteau_result, Exception):
+                raise portmanteau_result
+            elif portmanteau_result:
+                combo_word, delete_after = portmanteau_result
+                own_message = await message.channel.send(combo_word, delete_after=delete_after)
+                await own_message.add_reaction("\U0001F4BE")
+
+            keymash_confidence = analysis.get("keymash")
+            if isinstance(keymash_confidence, Exception):
+                raise keymash_confidence
+            elif keymash_confidence is not None and keymash_confidence > 0.85:
+                await message.channel.send(self.scramble(message_content.replace(" ","")),delete_after=20)
+            timer.lap("analysis") #the whole step: the jobs, waiting on them, and sending what they came up with
+
+            #keyword responses to the text itself go out right away. Images get read in the background and get a second pass of their own
+            response_count, matched_rules = await self.respond_to_keywords(message, context, timer=timer)
+
+            if not is_private and message.attachments:
+                task = asyncio.ensure_future(self.respond_to_images(message, message_content, matched_rules))
+                self.background_tasks.add(task)
+                task.add_done_callback(self.background_tasks.discard)
+            timer.lap("ocr")
 
             #Sometimes mock people
-            if response_count==0 and len(message_content)>8 and not "http" in message_content and random.random()<=0.003:
+            over_budget = pool.over_budget(started)
+            if response_count==0 and not over_budget and len(message_content)>8 and not "http" in message_content and random.random()<=0.003:
                 await message.channel.send(self.mocking_tone(message_content),delete_after=5)
 
             #Sometimes react to things
-            if response_count==0 and not "http" in message_content and random.random()<=0.003:
+            if response_count==0 and not over_budget and not "http" in message_content and random.random()<=0.003:
                 random_react = random.choice("👍💀❤️😳☺️😂🤣🙃😎👆😹😏🙌💯")
                 try:
                     await message.add_reaction(random_react)
@@ -3453,7 +3328,7 @@ class MusicBot(discord.Client):
 
         if isinstance(message.channel, discord.abc.PrivateChannel): #In the DMS
             
-            if not (message.author.id == self.config.owner_id and command == 'joinserver') and not any(command == dmcommand for dmcommand in self.dm_commands):
+            if not (message.author.id == self.config.owner_id and command == 'joinserver') and not command in self.dm_commands:
 
                 #If message is response to a whisper, send a reply whisper
                 if reference_dict: #this was from way earlier, rember?
@@ -3489,7 +3364,7 @@ class MusicBot(discord.Client):
 
 
 
-        if self.config.bound_channels and message.channel.id not in self.config.bound_channels and not isinstance(message.channel, discord.abc.PrivateChannel) and not any(command==anywherecommand for anywherecommand in self.anywhere_commands):
+        if self.config.bound_channels and message.channel.id not in self.config.bound_channels and not isinstance(message.channel, discord.abc.PrivateChannel) and not command in self.anywhere_commands:
             if self.config.unbound_servers:
                 for channel in message.guild.channels:
                     if channel.id in self.config.bound_channels:
@@ -3808,6 +3683,7 @@ class MusicBot(discord.Client):
 
         log.debug("Creating data folder for guild %s", guild.id)
         pathlib.Path('data/%s/' % guild.id).mkdir(exist_ok=True)
+        self.scorekeeper.set_group(guild.id, [member.id for member in guild.members])
 
     async def on_guild_remove(self, guild:discord.Guild):
         log.info("Bot has been removed from guild: {}".format(guild.name))
@@ -3817,6 +3693,15 @@ class MusicBot(discord.Client):
         if guild.id in self.players:
             self.players.pop(guild.id).kill()
 
+        self.scorekeeper.remove_group(guild.id)
+
+    #keeps the guild leaderboards (scorekeeper groups) up to date, so they never have to check members one by one
+    async def on_member_join(self, member):
+        self.scorekeeper.join_group(member.guild.id, member.id)
+
+    async def on_member_remove(self, member):
+        self.scorekeeper.leave_group(member.guild.id, member.id)
+
 
     async def on_guild_available(self, guild:discord.Guild):
         if not self.init_ok:
@@ -4312,13 +4197,11 @@ class MusicBot(discord.Client):
             text_title = user.name if not member else member.name +(" AKA "+member.nick if member.nick else "") #the things I do to save a line
             text_title += " [OWNER]" if user.id == self.config.owner_id else (" [DEV]" if str(user.id) in self.config.dev_ids else (" [JEFF]" if user.id==0000000 else ("[BNUUY]" if user==self.user else ("[BOT]" if user.bot else ""))))
 
-            #add scoreboard leader tags
-            top_gokus = self.getScoreboardTop("goku",guild_id=(None if not guild else guild.id))
-            top_scoopers = self.getScoreboardTop("pooper_scooper",guild_id=(None if not guild else guild.id))
-            top_wordles = self.getScoreboardTop("wordle_wins",guild_id=(None if not guild else guild.id))
-            text_title += " [GOKU]" if any(user.id==u.id for u in top_gokus) else ""
-            text_title += " [💩]" if any(user.id==u.id for u in top_scoopers) else ""
-            text_title += " [🟩]" if any(user.id==u.id for u in top_wordles) else ""
+            #add scoreboard leader tags. The scorekeeper keeps the leaders cached, so these are just lookups
+            guild_id = None if not guild else guild.id
+            text_title += " [GOKU]" if str(user.id) in self.scorekeeper.leaders("goku", group=guild_id) else ""
+            text_title += " [💩]" if str(user.id) in self.scorekeeper.leaders("pooper_scooper", group=guild_id) else ""
+            text_title += " [🟩]" if str(user.id) in self.scorekeeper.leaders("wordle_wins", group=guild_id) else ""
 
             embed = discord.Embed(title = text_title, color=user.color)
             embed.set_image(url = user.avatar_url)
@@ -4356,11 +4239,23 @@ class MusicBot(discord.Client):
             return
 
         start_time = time.time()
-        score = self.keymash_test(test_text)
+        score = await self.analysis_pool.run("keymash", test_text)
         end_time = time.time()
         await channel.send("KmaConfidence: "+str(round(score*100,2))+"%, Time: "+str(round(end_time-start_time,3))+" seconds")
         return
 
+    @dev_only
+    async def cmd_ocrstats(self, message, channel):
+        """
+        Usage:
+            {command_prefix}ocrstats
+
+        Shows how deep the image reading queue is and how its jobs have gone. Used for debugging.
+        """
+        stats = self.ocr.stats()
+        await channel.send("OCR queue: {queued} waiting, {running} running. {completed} done, {timeouts} timed out, {failures} failed, {dropped} dropped (queue full). Cache: {cached} images, {cache_hits} hits".format(**stats), delete_after=30)
+        return
+
     async def cmd_starwars(self, message, channel):
         """
         Usage:
@@ -4788,15 +4683,15 @@ class MusicBot(discord.Client):
                 inputs=[]
 
             if before=="ANYWHERE_COMMANDS":
-                self.anywhere_commands = []
+                self.anywhere_commands = set() #sets, since these only ever get checked for membership
                 for input in inputs:
-                    self.anywhere_commands.append(input)
+                    self.anywhere_commands.add(input)
                 #print(self.anywhere_commands)
 
             elif before=="DM_COMMANDS":
-                self.dm_commands = []
+                self.dm_commands = set()
                 for input in inputs:
-                    self.dm_commands.append(input)
+                    self.dm_commands.add(input)
                 #print(self.dm_commands)
 
             elif before=="MARGARET_IDS":                
@@ -4806,15 +4701,13 @@ class MusicBot(discord.Client):
                 #print(self.margaret_ids)
 
             elif before=="PORTMANTEAU_EXCLUDES":
-                self.portmanteau_excludes = []
-                for input in inputs:
-                    self.portmanteau_excludes.append(input)
+                self.portmanteau_excludes = tuple(inputs) #a tuple, so it can be handed straight to the analysis pool (and portmanteau.py indexes it by value)
                 #print(self.portmanteau_excludes)
 
             elif before=="UNFUN_GUILDS":                
-                self.unfun_guilds = []
+                self.unfun_guilds = set()
                 for input in inputs:
-                    self.unfun_guilds.append(int(input))
+                    self.unfun_guilds.add(int(input))
                 #print(self.unfun_guilds)
 
             elif before=="MAX_DAILY_GOKUS":
@@ -4837,6 +4730,26 @@ class MusicBot(discord.Client):
                 self.sloppiness_multiplier = float(after)
                 #print(self.sloppiness_multiplier)
 
+            elif before=="SCOREBOARD_BACKEND":
+                self.scoreboard_backend = after.lower()
+                #print(self.scoreboard_backend)
+
+            elif before=="SCOREBOARD_SAVE_INTERVAL":
+                self.scoreboard_save_interval = float(after)
+                #print(self.scoreboard_save_interval)
+
+            elif before=="COMPACT_SCOREBOARDS":
+                self.compact_scoreboards = after.lower()=="true"
+                #print(self.compact_scoreboards)
+
+            elif before=="ANALYSIS_WORKERS":
+                self.analysis_workers = int(after)
+                #print(self.analysis_workers)
+
+            elif before=="ANALYSIS_BUDGET":
+                self.analysis_budget = float(after)
+                #print(self.analysis_budget)
+
             else:
                 print("I have no idea what this means: "+before)
         return
@@ -4877,7 +4790,7 @@ class MusicBot(discord.Client):
         await message.add_reaction("✅")
         try:
             await self.alert_owner("Rebooting now!")
-            self.scorekeeper.save(force_all=True)
+            await asyncio.to_thread(self.scorekeeper.save, force_all=True)
             await self.cmd_autosave(None)
             await self.logout()
             await self.run_cli("sudo reboot now")
@@ -4901,7 +4814,7 @@ class MusicBot(discord.Client):
     async def start_reboot(self):
         await self.alert_owner("Rebooting in 30 minutes!")
         await self.run_cli("sudo shutdown -r +30")
-        self.scorekeeper.save(force_all=True)
+        await asyncio.to_thread(self.scorekeeper.save, force_all=True)
 
     #checks if the time has come to reboot, and starts the reboot process if so.
     async def reboot_maybe(self):
@@ -4968,10 +4881,9 @@ class MusicBot(discord.Client):
         self.clean_audio_cache()
         self.clean_image_cache()
         print("CLEANING SCOREBOARDS NOW")
-        await self.run_cli("rm "+os.path.abspath("misc_data/scoreboards/goku_attempts.json"))
-        await self.run_cli("rm "+os.path.abspath("misc_data/scoreboards/wordle_attempts.json"))
-        await self.run_cli("rm "+os.path.abspath("misc_data/scoreboards/wordle_finished.json"))
-        self.scorekeeper.load()
+        generation = datetime.now().strftime("%Y-%m-%d_%H%M%S") #to the second, so a manual shower still starts fresh boards
+        for daily_board in ["goku_attempts", "wordle_attempts", "wordle_finished"]:
+            self.scorekeeper.set_generation(daily_board, generation) #the old boards get thrown out whenever the scorekeeper gets around to it
         print("DONE")
         #print(self.scorekeeper.scoreboards)
         self.set_secret_word()
@@ -5097,33 +5009,13 @@ class MusicBot(discord.Client):
 
     def getScoreboardList(self, scoreboard_name, count=10, guild_id=None):
         """
-        retrieves the [count] top scoreboard lines from a scoreboard file (returns as list of Strings)
+        retrieves the [count] top scoreboard lines from a scoreboard (returns as list of Strings)
         if guild_id is specified, it will ignore users not in the specified guild
         returns a sorted list of strings, but the format is weird: [user_id];;[score]
-        TODO - actually implement dict processing
+        the sorting is done by the scorekeeper's leaderboard index, so this only ever looks at the top of the board
+        (and guilds have their own index, kept up to date by on_member_join and on_member_remove)
         """
-
-        scores_dict = self.scorekeeper.get_scoreboard(scoreboard_name, show_none=False)
-        lines=[]
-        for key in scores_dict:
-            if key=="__saved__":
-                continue
-            try:
-                lines.append(key+";;"+str(int(scores_dict[key]))) #this is a hacky fix - only allows int scores
-            except TypeError: #in case a score is not an int or something
-                continue
-
-        lines = sorted(lines, key=lambda line: int(line.split(";;",1)[1])) #Sorts list in order of score. Not sure how I would do this to a dict.
-
-        guild = self.get_guild(guild_id) if guild_id else None
-        board = []
-        for i in range(len(lines)-1,-1,-1):
-            line = lines[i].replace("\n","")
-            if len(board)>=count:
-                break
-            if guild and not guild.get_member(int(line.split(";;",1)[0])):
-                continue
-            board.append(line)
+        board = [key+";;"+str(int(score)) for key, score in self.scorekeeper.top(scoreboard_name, count, group=guild_id)] #only shows int scores
 
         #remove trailing zeros - done at the end in case you want a scoreboard that can go negative
         for i in range(len(board)-1,-1,-1):
@@ -5135,7 +5027,7 @@ class MusicBot(discord.Client):
         return board
 
     
-    def getScoreboardListPretty(self, scoreboard_name, count=10, guild_id=None):
+    async def getScoreboardListPretty(self, scoreboard_name, count=10, guild_id=None):
         """
         wrapper for getScoreboardList. Formats the lines into a readable ranked list (rank, username, score)
         returns a list of Strings
@@ -5149,30 +5041,21 @@ class MusicBot(discord.Client):
             if int(line_info[1])<last_score or last_score==0:
                 counter += 1
                 last_score = int(line_info[1])
-            user = self.get_user(int(line_info[0]))
-            user = user if user else self.fetch_user(int(line_info[0])) #hopefully it doesn't come down to this
+            user = await self.get_user_cached(int(line_info[0]))
             nice_board.append(str(counter)+".   "+user.name+":    "+line_info[1])
 
         return nice_board
 
-    #grabs the User object(s) for the top user(s) of the specified scoreboard. Returns them in a list.
-    #if guild_id is specified, will only search for users in the given guild
-    def getScoreboardTop(self, scoreboard_name, guild_id=None):
-        board = self.getScoreboardList(scoreboard_name, count=1, guild_id=guild_id)
-        if len(board)==0:
-            return None
-        users = []
-        top_score = int(board[0].split(";;",1)[1])
-        for b in board:
-            user_id = int(b.split(";;",1)[0])
-            user_score = int(b.split(";;",1)[1])
-            if user_score<top_score:
-                break
-            user = self.get_user(user_id)
-            user = user if user else self.fetch_user(user_id)
-            users.append(user)
-        
-        return users
+    async def get_user_cached(self, user_id):
+        """
+        get_user, but falls back to fetch_user (an API call) for users the client doesn't have cached. Fetched users are remembered for a while.
+        """
+        user = self.get_user(user_id) or self.fetched_users.get(user_id)
+        if user is None:
+            user = self.fetched_users[user_id] = await self.fetch_user(user_id)
+            if len(self.fetched_users) > 256:
+                self.fetched_users.pop(next(iter(self.fetched_users))) #oldest first
+        return user
 
     async def cmd_goku(self, message, channel):
         """
@@ -5182,7 +5065,7 @@ class MusicBot(discord.Client):
         Gives you a ranked list of the top Gokus on your server.
         """
 
-        board = self.getScoreboardListPretty("goku", count=10, guild_id=channel.guild.id)
+        board = await self.getScoreboardListPretty("goku", count=10, guild_id=channel.guild.id)
         output_string=""
         for line in board:
             output_string+=line+"\n"
@@ -5204,7 +5087,7 @@ class MusicBot(discord.Client):
         Gives you a ranked list of the top pooper scoopers.
         """
 
-        board = self.getScoreboardListPretty("pooper_scooper", count=10, guild_id=channel.guild.id)
+        board = await self.getScoreboardListPretty("pooper_scooper", count=10, guild_id=channel.guild.id)
         output_string=""
         for line in board:
             output_string+=line+"\n"
@@ -5225,7 +5108,7 @@ class MusicBot(discord.Client):
         Gives you a ranked list of the top wordle scorers on your server.
         """
 
-        board = self.getScoreboardListPretty("wordle_wins", count=10, guild_id=channel.guild.id)
+        board = await self.getScoreboardListPretty("wordle_wins", count=10, guild_id=channel.guild.id)
         output_string=""
         for line in board:
             output_string+=line+"\n"
@@ -6210,8 +6093,11 @@ class MusicBot(discord.Client):
 
         await self.dumpy_check() #you gotta do what you gotta do
 
-        if not self.scorekeeper.is_saved:
-            self.scorekeeper.save()
+        await asyncio.to_thread(self.rule_store.refresh) #pick up any edits to responses.txt and the emote files
+
+        if not self.ocr.cache.is_saved and time.monotonic()-self.ocr_cache_saved_at >= self.OCR_CACHE_SAVE_INTERVAL:
+            self.ocr_cache_saved_at = time.monotonic()
+            await asyncio.to_thread(self.ocr.cache.write, self.ocr.cache.snapshot()) #rewrites the whole file, so not on the event loop
 
         #if datetime.now().second == 0: #stuff to do every minute
         #    pass
@@ -6586,7 +6472,7 @@ class MusicBot(discord.Client):
 
         Experimental:
         If you use the command as a reply to another message that contains just images, it will emojify any text that was parsed from the images 
-        Note: Image parsed text only works if the images were sent in the last day, and the images were not sent as urls. 
+        Note: Image parsed text only works if the images were not sent as urls. 
         You may need to wait a minute for the rabbit to read the image.
         """
 
@@ -6602,14 +6488,15 @@ class MusicBot(discord.Client):
             old_message = old_message if old_message else (await channel.fetch_message(message.reference.message_id))
             message_text = old_message.content
             if not message_text: #try to find attachments that may have been parsed
-                file_list = os.listdir(os.path.abspath("image_cache"))
-                cache_file = "out"+str(old_message.id)+".txt"
-                if cache_file in file_list:
-                    with open(os.path.abspath("image_cache/"+cache_file),"r") as f:
-                        message_text += "".join(f.readlines())
+                image_text = self.ocr.cache.for_message(old_message.id)
+                if image_text is None: #not cached under this message (anymore), so go by the images themselves. Reposts are probably cached already
+                    images = await self.read_image_attachments(old_message)
+                    image_text = await self.ocr.read(images, old_message.id) if images else None
+                if image_text:
+                    message_text += image_text
                 else:
                     if len(old_message.attachments)>0:
-                        await channel.send("I couldn't find anything to emojify.\nIf you're trying to emojify text from an image, make sure the image was sent *today* (and not by a bot).",delete_after=30)
+                        await channel.send("I couldn't find anything to emojify.\nIf you're trying to emojify text from an image, I might just be too busy reading other images right now. Try again in a minute.",delete_after=30)
                     else:
                         await channel.send("I couldn't find anything to emojify.",delete_after=30)
                     return
@@ -6848,7 +6735,7 @@ class MusicBot(discord.Client):
         if self.getScoreboard(channel.guild.id, "wordle_finished")>0:
             await channel.send("Sorry, someone already guessed the secret word in this server today. Try again tomorrow. :heart:", delete_after=30)
             return
-        elif self.getScoreboard(message.author.id, "wordle_finished")>0:
+        elif self.scorekeeper.is_marked("wordle_finished", message.author.id): #one of their other servers already got it
             await channel.send("Sorry, but the secret word was already guessed in another server you're in. Try again tomorrow. :wink:", delete_after=30)
             return
 
@@ -6859,9 +6746,7 @@ class MusicBot(discord.Client):
         if feedback.endswith(":100:"):
             await channel.send(message.author.mention+" GUESSED THE WORD! It took this server "+str(attempts)+" tries to guess the word! Good job! :heart:")
             self.changeScoreboard(message.author.id, "wordle_wins")
-            self.changeScoreboard(channel.guild.id, "wordle_finished")
-            for member in channel.guild.members:
-                self.changeScoreboard(member.id, "wordle_finished")
+            self.scorekeeper.mark_group("wordle_finished", channel.guild.id) #marks everyone in the server at once (see on_member_join)
 
         return
 
@@ -7033,11 +6918,12 @@ class MusicBot(discord.Client):
         line = "{emote},".join(triggers)+"{emote};"+",".join(emotes)+"\n"
 
         if everywhere:
-            with open(os.path.abspath("emotes/default.txt".format(channel.guild.id)),'a') as f:
-                f.write(line)
+            emote_file = self.rule_store.default_emotes_file
         else:
-            with open(os.path.abspath("emotes/{}.txt".format(channel.guild.id)),'a') as f:
-                f.write(line)
+            emote_file = self.rule_store.guild_file(channel.guild.id)
+        with open(emote_file,'a') as f:
+            f.write(line)
+        await asyncio.to_thread(self.rule_store.reload, emote_file) #so the new emote works right away (recompiling the default emotes is slow, so not on the event loop)
 
         await message.add_reaction("✅")
         return
@@ -7397,7 +7283,7 @@ class MusicBot(discord.Client):
             try:
                 name1 = random.choice(names)
                 name2 = random.choice(names).lower()
-                combo_name = self.portmanteau(name1, name2)
+                combo_name = portmanteau(name1, name2)
                 if not combo_name or combo_name==name1 or combo_name==name2:
                     continue
                 results.append(combo_name)
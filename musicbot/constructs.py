@@ -1,6 +1,7 @@
 import json
 import pydoc
 import inspect
+import time
 import logging
 
 import discord
@@ -54,6 +55,45 @@ class Response:
         else:
             return self._content
 
+class StageTimer:
+    """
+    Accumulates how long each stage of a handler takes. Call begin() at the start, then lap("stage") at the end of every stage.
+    Does nothing unless enabled, so it can stay in on_message permanently.
+    """
+    __slots__ = ['enabled', 'totals', 'counts', '_last']
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.totals = {}
+        self.counts = {}
+        self._last = 0.0
+
+    def begin(self):
+        if self.enabled:
+            self._last = time.perf_counter()
+
+    def lap(self, stage):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.totals[stage] = self.totals.get(stage, 0.0) + (now - self._last)
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+        self._last = now
+
+    def add(self, stage, seconds):
+        """
+        Records a stage that was timed somewhere else (like a job in an analysis worker). Doesn't count as a lap.
+        """
+        if not self.enabled:
+            return
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def reset(self):
+        self.totals.clear()
+        self.counts.clear()
+
+
 # Alright this is going to take some actual thinking through
 class AnimatedResponse(Response):
     def __init__(self, content, *sequence, delete_after=0):
@@ -0,0 +1,199 @@
+"""
+Keymash detection. Plain functions with no bot state, so they can run in the analysis pool (see analysis.py).
+
+A message gets turned into a histogram of its characters and character pairs (28 singles followed by 28*28 pairs,
+the same 812 slots as keymash_data/*.txt) and compared against an English and a keymash reference distribution
+with a chi-squared test. The references are loaded into NumPy arrays once, and the histograms are built with
+np.bincount, so scoring a message doesn't touch any Python-level loops over its characters.
+
+The references live in keymash_data/keymash_model.npy, a single versioned record that gets memory-mapped instead of
+parsed. build_keymash_model.py (in the repo root) rebuilds it from text corpora like channel_archives exports.
+The original hand-made data_eng.txt and data_kma.txt are still used if there's no model file.
+"""
+
+import os
+import json
+
+import numpy as np
+
+CHARACTERS = "abcdefghijklmnopqrstuvwxyz. "
+SINGLES = len(CHARACTERS)
+SLOTS = SINGLES + SINGLES**2
+
+MODEL_FILE = "keymash_model.npy"
+MODEL_VERSION = 1 #bump whenever the histogram layout changes, so old model files get rejected instead of misread
+MODEL_DTYPE = np.dtype([("version", "<u4"), ("characters", "S{}".format(SINGLES)), ("eng", "<f8", (SLOTS,)), ("kma", "<f8", (SLOTS,))])
+
+#maps a codepoint to its slot. Anything that isn't in CHARACTERS counts as a space
+_CHARACTER_TABLE = np.full(128, CHARACTERS.index(" "), dtype=np.intp)
+for _i, _c in enumerate(CHARACTERS):
+    _CHARACTER_TABLE[ord(_c)] = _i
+
+
+class KeymashModel:
+    """
+    The English and keymash reference distributions, with everything the chi-squared test needs precomputed.
+    """
+    __slots__ = ("expected", "weights", "scaled", "constant")
+
+    def __init__(self, eng, kma):
+        self.expected = np.vstack([eng, kma]).astype(np.float64)        #(2, SLOTS)
+        self.weights = 1.0 / np.maximum(self.expected, 0.00001)          #chi-squared divisors, inverted once
+        #sum((o-e)^2/d) == sum(o^2/d) - 2*sum(o*e/d) + sum(e^2/d), which turns a batch of tests into two matrix products
+        self.scaled = self.expected * self.weights
+        self.constant = (self.expected * self.scaled).sum(axis=1)
+
+    @property
+    def eng(self):
+        return self.expected[0]
+
+    @property
+    def kma(self):
+        return self.expected[1]
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Maps a model file written by save(). Raises ValueError if it was built for a different version or alphabet.
+        """
+        record = np.load(os.path.abspath(path), mmap_mode="r")
+        if record.dtype != MODEL_DTYPE or record.shape != (1,):
+            raise ValueError("{} isn't a keymash model".format(path))
+        if int(record["version"][0]) != MODEL_VERSION or record["characters"][0].decode() != CHARACTERS:
+            raise ValueError("{} was built for a different version of the keymash model".format(path))
+        return cls(record["eng"][0], record["kma"][0])
+
+    @classmethod
+    def from_text(cls, directory="keymash_data"):
+        """
+        Loads data_eng.txt and data_kma.txt (one float per line).
+        """
+        eng = np.loadtxt(os.path.abspath(os.path.join(directory, "data_eng.txt")), dtype=np.float64)
+        kma = np.loadtxt(os.path.abspath(os.path.join(directory, "data_kma.txt")), dtype=np.float64)
+        return cls(eng, kma)
+
+    def chi_squared(self, histograms):
+        """
+        Chi-squared of every histogram (n, SLOTS) against both references. Returns an (n, 2) array.
+        """
+        return (histograms**2) @ self.weights.T - 2 * (histograms @ self.scaled.T) + self.constant
+
+    def save(self, path):
+        """
+        Writes the model as a single MODEL_DTYPE record. Goes through a temp file so a half-written model never gets loaded.
+        """
+        record = np.zeros(1, dtype=MODEL_DTYPE)
+        record["version"] = MODEL_VERSION
+        record["characters"] = CHARACTERS.encode()
+        record["eng"] = self.eng
+        record["kma"] = self.kma
+        temp_path = os.path.abspath(path)+".tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, record)
+        os.replace(temp_path, os.path.abspath(path))
+
+
+_model = None
+
+
+def load_model(directory="keymash_data"):
+    """
+    Loads the reference distributions (once per process) and returns them.
+    Uses the model file if there is one, otherwise the old text files.
+    """
+    global _model
+    if _model is None:
+        path = os.path.join(directory, MODEL_FILE)
+        if os.path.isfile(os.path.abspath(path)):
+            _model = KeymashModel.from_file(path)
+        else:
+            _model = KeymashModel.from_text(directory)
+    return _model
+
+
+def _slots(text):
+    """
+    The slot of every character of text (lowered) as an array.
+    """
+    codes = np.frombuffer(text.lower().encode("utf-32-le"), dtype=np.uint32)
+    return np.where(codes < 128, _CHARACTER_TABLE[np.minimum(codes, 127)], _CHARACTER_TABLE[32])
+
+
+def histograms(texts):
+    """
+    Relative frequencies of every single character followed by every character pair, for each of texts. Returns an (n, SLOTS) array.
+    """
+    slots = [_slots(text) for text in texts]
+    lengths = np.array([len(s) for s in slots], dtype=np.intp)
+    if not len(slots):
+        return np.zeros((0, SLOTS))
+    flat = np.concatenate(slots) if lengths.sum() else np.zeros(0, dtype=np.intp)
+    owners = np.repeat(np.arange(len(slots)), lengths) #which text each character belongs to
+
+    counts = np.bincount(owners*SLOTS + flat, minlength=len(slots)*SLOTS)
+    same_text = owners[:-1] == owners[1:] #pairs never straddle two texts
+    pairs = (owners[:-1]*SLOTS + SINGLES + flat[:-1]*SINGLES + flat[1:])[same_text]
+    counts += np.bincount(pairs, minlength=len(slots)*SLOTS)
+
+    return counts.reshape(len(slots), SLOTS) / np.maximum(lengths, 1)[:, None]
+
+
+def keymash_test_many(texts):
+    """
+    keymash_test for a batch of texts at once. Returns a list of confidences (empty texts get 0.0).
+    """
+    if not texts:
+        return []
+    model = load_model()
+    scores = model.chi_squared(histograms(texts)) / np.array([max(len(text), 1) for text in texts])[:, None]
+    totals = scores.sum(axis=1)
+    confidences = np.divide(scores[:, 0], totals, out=np.zeros(len(texts)), where=totals > 0)
+    return [float(confidence) if text else 0.0 for confidence, text in zip(confidences, texts)]
+
+
+def keymash_test(input_text):
+    """
+    Runs two tests to determine how confident the bot is that an input string is keymashing.
+    Outputs a value from 0.0 to 1.0, where 1.0 is 100% confidence the input is keymashing.
+    """
+    return keymash_test_many([input_text])[0]
+
+
+def build_distribution(texts):
+    """
+    The reference distribution of a corpus: character and character pair counts over all of texts (pairs never
+    straddle two texts), divided by the total number of characters. Same layout as a single message's histogram.
+    """
+    texts = [text for text in texts if text]
+    if not texts:
+        raise ValueError("Can't build a distribution from an empty corpus")
+    counts = np.zeros(SLOTS)
+    total = 0
+    for start in range(0, len(texts), 1000): #in chunks, since every text gets a full row of slots
+        chunk = texts[start:start+1000]
+        lengths = np.array([len(text.lower()) for text in chunk], dtype=np.float64)
+        counts += (histograms(chunk) * lengths[:, None]).sum(axis=0)
+        total += lengths.sum()
+    return counts / total
+
+
+def read_corpus(path):
+    """
+    Yields the messages in a corpus file. Understands channel_archives exports (json lines, ## headers),
+    anything else is treated as plain text with one message per line.
+    """
+    with open(os.path.abspath(path), "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("##"):
+                continue
+            if line.startswith("{"):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if isinstance(entry, dict):
+                    if entry.get("content"): #member entries don't have any
+                        yield entry["content"]
+                    continue
+            yield line
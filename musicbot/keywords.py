@@ -0,0 +1,579 @@
+import os
+import re
+import logging
+import threading
+from operator import add
+from functools import cached_property
+
+log = logging.getLogger(__name__)
+
+#letters from most to least common in english text. Anything not in here (digits, punctuation, emoji...) counts as rarer than all of them
+_LETTER_FREQUENCY = "etaoinsrhldcumfpgwybvkxjqz"
+
+#punctuation removed from messages before matching, and the punctuation that separates words for {alone} keys
+_MESSAGE_CLEANING_TAGS = [",","’","'","\""]
+_WORD_BREAKS = ".!?,;:\"'"
+_WORD_BREAK_TABLE = str.maketrans(_WORD_BREAKS, " "*len(_WORD_BREAKS))
+
+#splits on ; and , unless they're escaped with a backslash
+_SEMICOLON_SPLIT = re.compile(r"(?<!\\);")
+_COMMA_SPLIT = re.compile(r"(?<!\\),")
+
+
+class TriggerIndex:
+
+    """==========================================================================
+    Aho-Corasick automaton for finding every trigger key inside a message in a single pass.
+    Each pattern is added with a value (anything hashable). find() returns the values of every pattern that shows up
+    anywhere in the text, so the cost no longer depends on how many keys there are.
+    Empty patterns always match (same as "" in text).
+    =============================================================================
+    """
+
+    def __init__(self, pairs=()):
+        self._goto = [{}]     #node -> {character: next node}
+        self._fail = [0]      #node -> fallback node for the longest proper suffix
+        self._out = [()]      #node -> pattern ids that end here (including the ones inherited from fail links)
+        self._values = []     #pattern id -> list of values
+        self._pattern_ids = {}
+        self._always = ()     #pattern ids of empty patterns
+        self._built = False
+        for pattern, value in pairs:
+            self.add(pattern, value)
+        self.build()
+
+
+    def add(self, pattern, value):
+        """
+        Adds a pattern to the index. Patterns that were already added just collect the extra value.
+        The index must be (re)built before searching again.
+        """
+        self._built = False
+        try:
+            self._values[self._pattern_ids[pattern]].append(value)
+            return
+        except KeyError:
+            pattern_id = len(self._values)
+            self._pattern_ids[pattern] = pattern_id
+            self._values.append([value])
+
+        if not pattern:
+            self._always += (pattern_id,)
+            return
+
+        node = 0
+        for ch in pattern:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = next_node
+        self._out[node] += (pattern_id,)
+
+
+    def build(self):
+        """
+        Computes the failure links breadth-first and merges the outputs of each node's suffixes into it.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = []
+        for node in goto[0].values():
+            fail[node] = 0
+            queue.append(node)
+
+        i = 0
+        while i < len(queue): #plain list instead of a deque - we need to keep the whole thing anyway
+            node = queue[i]
+            i += 1
+            for ch, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[child] = f if f != child else 0
+                if out[fail[child]]:
+                    out[child] = out[child] + out[fail[child]]
+        self._built = True
+
+
+    def find(self, text):
+        """
+        Returns a list with the values of every pattern found in text.
+        Each value is returned once, no matter how many times its pattern occurs. Order is not guaranteed.
+        """
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(self._always)
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+
+        values = []
+        for pattern_id in found:
+            values.extend(self._values[pattern_id])
+        return values
+
+
+    def __len__(self):
+        return len(self._values)
+
+
+
+class MessageContext:
+
+    """
+    All the different normalized forms of one message's text, each computed the first time something asks for it and
+    then shared by every responder (portmanteaus, keymash, keyword matching, {random}, {alone}...).
+    """
+
+    def __init__(self, content):
+        self.content = content
+
+
+    @cached_property
+    def lowered(self):
+        """The message lowercased and stripped"""
+        return self.content.lower().strip()
+
+    @cached_property
+    def tokens(self):
+        """The message split on whitespace (used for portmanteaus)"""
+        return self.content.split()
+
+    @cached_property
+    def lowered_tokens(self):
+        return [token.lower() for token in self.tokens]
+
+    @cached_property
+    def words(self):
+        """The lowered message split on single spaces (used for {random})"""
+        return self.lowered.split(" ")
+
+    @cached_property
+    def cleaned(self):
+        """The lowered message with common punctuation removed - what the trigger keys get matched against"""
+        cleaned = self.lowered
+        for tag in _MESSAGE_CLEANING_TAGS:
+            cleaned = cleaned.replace(tag,"")
+        return cleaned
+
+    @cached_property
+    def alone_words(self):
+        """The words of the cleaned message once the remaining punctuation is turned into spaces"""
+        return frozenset(self.cleaned.translate(_WORD_BREAK_TABLE).split(" "))
+
+    @cached_property
+    def alone_padded(self):
+        """The same thing as alone_words, as one string padded with spaces so whole phrases can be looked up"""
+        return " "+self.cleaned.translate(_WORD_BREAK_TABLE)+" "
+
+
+    def key_is_alone(self, key):
+        """
+        Tells you if a TriggerKey shows up in the message on its own (not a part of any other words).
+        """
+        if key.alone_form.startswith(" "): #multi-word key
+            return key.alone_form in self.alone_padded
+        return key.alone_form in self.alone_words
+
+
+class TriggerKey:
+
+    """
+    One trigger key of a rule, with its tags already pulled out into flags.
+    text is the key as written ({emote} expanded), cleaned is what actually gets searched for in the cleaned message.
+    """
+
+    __slots__ = ['text', 'cleaned', 'alone_form', 'alone', 'noimg', 'jeff', 'gokuattempt', 'a', 'only', 'nodel', 'deleteorig', 'fast', 'vfast', 'rare', 'vrare']
+
+    CLEANING_TAGS = ["{noimg}","{deleteorig}","{jeff}","{nodel}","{only}","{a}","{alone}","{gokuattempt}","{fast}","{vfast}","{rare}","{vrare}"]
+
+    def __init__(self, text):
+        text = text.replace("{emote}","{a}{noimg}{nodel}")
+        self.text = text
+        cleaned = text.lower().strip()
+        for tag in self.CLEANING_TAGS:
+            cleaned = cleaned.replace(tag,"")
+        self.cleaned = cleaned
+        #what {alone} looks for: the key with punctuation turned into spaces, and padded with spaces if it's more than one word
+        alone_form = cleaned.translate(_WORD_BREAK_TABLE)
+        self.alone_form = alone_form if len(alone_form.split(" ")) == 1 else " "+alone_form+" "
+        for tag in self.__slots__[3:]:
+            setattr(self, tag, "{"+tag+"}" in text)
+
+
+class ResponseTemplate:
+
+    """
+    A single response, compiled once when its file is loaded.
+    All the boolean-like tags and {react}{XXX} reactions are pulled out into attributes, and the remaining text is split
+    into parts where every odd part is the name of a fill-in tag ({author}, {trail}, ...). {break} stays in the text.
+    Responses with fill-in tags get filled in with one pass of render().
+    """
+
+    __slots__ = ['parts', 'placeholders', 'reactions', 'a', 'only', 'nodel', 'deleteorig', 'fast', 'vfast', 'rare', 'vrare', 'goku']
+
+    FLAG_TAGS = ["a", "only", "nodel", "deleteorig", "fast", "vfast", "rare", "vrare", "goku"]
+    PLACEHOLDERS = ["author", "atauthor", "time", "date", "weekday", "random", "trail", "trail1", "lead", "lead1"]
+    MAX_REACTIONS = 20
+
+    def __init__(self, text):
+        #pull out the reactions first ("{react}{XXX}")
+        self.reactions = []
+        cleaned = ""
+        while "{react}" in text and len(self.reactions) < self.MAX_REACTIONS:
+            before, _, text = text.partition("{react}")
+            cleaned += before
+            reaction, _, text = text.partition("}")
+            self.reactions.append(reaction.replace("{","").replace(" ","")) #spaces are a common mistake, so they just get removed
+        text = cleaned + text
+
+        for tag in self.FLAG_TAGS:
+            setattr(self, tag, "{"+tag+"}" in text)
+            text = text.replace("{"+tag+"}","")
+
+        self.parts = _PLACEHOLDER_SPLIT.split(text)
+        self.placeholders = frozenset(self.parts[1::2])
+
+
+    @property
+    def needs_trail(self):
+        return "trail" in self.placeholders or "trail1" in self.placeholders
+
+    @property
+    def needs_lead(self):
+        return "lead" in self.placeholders or "lead1" in self.placeholders
+
+
+    def render(self, values):
+        """
+        Fills in the response. values must map every name in placeholders to its text.
+        """
+        if len(self.parts) == 1:
+            return self.parts[0]
+        parts = list(self.parts)
+        parts[1::2] = [values[name] for name in self.parts[1::2]]
+        return "".join(parts)
+
+
+_PLACEHOLDER_SPLIT = re.compile("{("+"|".join(ResponseTemplate.PLACEHOLDERS)+")}")
+
+
+class ResponseRule:
+
+    """
+    A single "keys;responses" line from responses.txt or one of the emote files.
+    keys is a list of TriggerKeys and responses is a list of ResponseTemplates (with the escape backslashes removed).
+    """
+
+    __slots__ = ['keys', 'responses', 'line']
+
+    def __init__(self, line):
+        self.line = line
+        parts = _SEMICOLON_SPLIT.split(line)
+        self.keys = [TriggerKey(key) for key in _COMMA_SPLIT.split(parts[0])]
+        self.responses = [ResponseTemplate(response.replace("\\","")) for response in _COMMA_SPLIT.split(parts[1])]
+
+
+def _bigram_rarity(bigram):
+    return _letter_rarity(bigram[0]) + _letter_rarity(bigram[1])
+
+
+def _letter_rarity(ch):
+    index = _LETTER_FREQUENCY.find(ch)
+    return len(_LETTER_FREQUENCY) if index < 0 else index
+
+
+def parse_rules(lines):
+    """
+    Parses the lines of a rules file into a tuple of ResponseRules.
+    Skips blank lines, ## comments, and lines that have no responses.
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip() or line.startswith("##") or not _SEMICOLON_SPLIT.search(line):
+            continue
+        rules.append(ResponseRule(line))
+    return tuple(rules)
+
+
+class Ruleset:
+
+    """
+    A group of response rules compiled into one TriggerIndex.
+    match() gives back the rules in file order, each with the keys that were found (in key order), which is the same
+    order the old line-by-line loop visited them in.
+
+    Most messages don't contain any key at all, so there's also a prefilter: every key is boiled down to its rarest
+    character pair (or its only character), and a message that contains none of those can't possibly match anything.
+    Checking that is a couple of set operations instead of walking the automaton.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.index = TriggerIndex(
+            (key.cleaned, (rule_number, key_number))
+            for rule_number, rule in enumerate(self.rules)
+            for key_number, key in enumerate(rule.keys)
+        )
+
+        self.prefilter_chars = set()
+        self.prefilter_bigrams = set()
+        self.always_check = False #set when there's an empty key (which matches everything)
+        for rule in self.rules:
+            for key in rule.keys:
+                if not key.cleaned:
+                    self.always_check = True
+                elif len(key.cleaned) == 1:
+                    self.prefilter_chars.add(key.cleaned)
+                else:
+                    self.prefilter_bigrams.add(max(map(add, key.cleaned, key.cleaned[1:]), key=_bigram_rarity))
+
+
+    def might_match(self, cleaned_message):
+        """
+        Quick check for whether any key could be in cleaned_message. False means definitely not, True means maybe.
+        """
+        if self.always_check:
+            return True
+        if not self.prefilter_chars.isdisjoint(cleaned_message):
+            return True
+        return not self.prefilter_bigrams.isdisjoint(map(add, cleaned_message, cleaned_message[1:]))
+
+
+    def match(self, cleaned_message):
+        """
+        Returns a list of (rule, [key, ...]) for every rule with at least one key inside cleaned_message.
+        """
+        if not self.might_match(cleaned_message):
+            return []
+        hits = sorted(self.index.find(cleaned_message))
+        matches = []
+        last_rule = -1
+        for rule_number, key_number in hits:
+            rule = self.rules[rule_number]
+            if rule_number != last_rule:
+                matches.append((rule, []))
+                last_rule = rule_number
+            matches[-1][1].append(rule.keys[key_number])
+        return matches
+
+
+    def __len__(self):
+        return len(self.rules)
+
+
+class LayeredRuleset:
+
+    """
+    A guild's rules as two Rulesets: the shared one (responses.txt + default emotes, compiled once for everybody)
+    and a small one with just the guild's own emotes. match() gives the same results as one Ruleset of all of them would,
+    since the guild's rules come after the shared ones either way.
+    """
+
+    def __init__(self, shared, own):
+        self.shared = shared
+        self.own = own
+
+
+    @property
+    def rules(self):
+        return self.shared.rules + self.own.rules
+
+
+    def might_match(self, cleaned_message):
+        return self.shared.might_match(cleaned_message) or self.own.might_match(cleaned_message)
+
+
+    def match(self, cleaned_message):
+        return self.shared.match(cleaned_message) + self.own.match(cleaned_message)
+
+
+    def __len__(self):
+        return len(self.shared) + len(self.own)
+
+
+class RuleStore:
+
+    """==========================================================================
+    Keeps the parsed contents of responses.txt and every emotes/*.txt file in memory so on_message never touches the disk.
+    refresh() polls the files' modification times and sizes and re-parses the ones that changed.
+    The parsed files live in one dict that gets replaced as a whole, so a refresh running in another thread
+    never leaves a half-updated set of rules behind.
+
+    responses.txt and the default emotes are compiled into one shared Ruleset, and each guild with an emote file gets a
+    LayeredRuleset of that plus a small Ruleset of its own emotes. All of the compiling happens when files get (re)loaded,
+    which is off the event loop, and the new Rulesets are swapped in all at once. So ruleset_for() is just a lookup,
+    and a change to responses.txt or emotes/default.txt only recompiles the shared rules once instead of once per guild.
+    =============================================================================
+    """
+
+    def __init__(self, responses_file="responses.txt", emotes_dir="emotes"):
+        self.responses_file = os.path.abspath(responses_file)
+        self.emotes_dir = os.path.abspath(emotes_dir)
+        self.default_emotes_file = os.path.join(self.emotes_dir, "default.txt")
+        self.files = {}     #path -> (stamp, rules)
+        self.rulesets = {None: Ruleset(())} #guild id -> compiled Ruleset. None has the shared one, for DMs and guilds without emotes
+        self._lock = threading.Lock() #only one refresh()/reload() swaps things in at a time
+        self.refresh()
+
+
+    def guild_file(self, guild_id):
+        """
+        Returns the path of the emote file for a guild.
+        """
+        return os.path.join(self.emotes_dir, "{}.txt".format(guild_id))
+
+
+    def refresh(self):
+        """
+        Checks every watched file for changes and reloads the ones that were added, modified, or removed.
+        Returns a list of the paths that changed.
+        """
+        stamps = {}
+        stamp = self._stamp(self.responses_file)
+        if stamp:
+            stamps[self.responses_file] = stamp
+        try:
+            for entry in os.scandir(self.emotes_dir):
+                if entry.name.endswith(".txt") and not entry.name.startswith("."): #ignore the ._ junk files
+                    stat = entry.stat()
+                    stamps[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+
+        #do the slow parsing before taking the lock
+        current = self.files
+        loaded = {}
+        for path, stamp in stamps.items():
+            old = current.get(path)
+            if not old or old[0] != stamp:
+                loaded[path] = (stamp, self._load(path))
+        removed = [path for path in current if path not in stamps]
+
+        if loaded or removed:
+            self._apply(loaded, removed)
+            log.debug("Reloaded response rules from: {}".format(", ".join(list(loaded)+removed)))
+        return list(loaded)+removed
+
+
+    def reload(self, path):
+        """
+        Immediately reloads a single file (used right after the bot writes to one itself).
+        """
+        path = os.path.abspath(path)
+        stamp = self._stamp(path)
+        if stamp:
+            self._apply({path: (stamp, self._load(path))}, [])
+        else:
+            self._apply({}, [path])
+
+
+    def get_rules(self, path):
+        """
+        Returns the parsed rules of a watched file, or an empty tuple if it doesn't exist.
+        """
+        try:
+            return self.files[path][1]
+        except KeyError:
+            return ()
+
+
+    def rules_for(self, guild_id=None):
+        """
+        Returns every rule that applies to a guild: responses.txt, then the default emotes, then the guild's own emotes.
+        """
+        files = self.files
+        rules = ()
+        for path in (self.responses_file, self.default_emotes_file, self.guild_file(guild_id) if guild_id else None):
+            try:
+                rules += files[path][1]
+            except KeyError:
+                continue
+        return rules
+
+
+    def ruleset_for(self, guild_id=None):
+        """
+        Returns the compiled Ruleset for a guild (None for DMs). Never compiles anything, so it's safe on the event loop.
+        """
+        rulesets = self.rulesets
+        return rulesets.get(guild_id) or rulesets[None]
+
+
+    def _apply(self, loaded, removed):
+        """
+        Swaps new file contents in, compiles the Rulesets that used the old ones, and swaps those in too.
+        Slow when responses.txt or the default emotes changed, so call it off the event loop.
+        """
+        with self._lock:
+            files = dict(self.files)
+            files.update(loaded)
+            for path in removed:
+                files.pop(path, None)
+
+            changed = list(loaded)+list(removed)
+            old = self.rulesets
+            shared = old[None]
+            if self.responses_file in changed or self.default_emotes_file in changed:
+                shared = Ruleset(self._file_rules(files, self.responses_file) + self._file_rules(files, self.default_emotes_file))
+            own = {guild_id: ruleset.own for guild_id, ruleset in old.items() if guild_id is not None}
+            for path in changed:
+                guild_id = self._guild_of(path)
+                if guild_id is None:
+                    continue
+                rules = self._file_rules(files, path)
+                if rules:
+                    own[guild_id] = Ruleset(rules)
+                else:
+                    own.pop(guild_id, None)
+
+            rulesets = {guild_id: LayeredRuleset(shared, ruleset) for guild_id, ruleset in own.items()}
+            rulesets[None] = shared
+            self.files = files
+            self.rulesets = rulesets #swap everything in at once
+
+
+    def _guild_of(self, path):
+        """
+        The guild id an emote file belongs to, or None for responses.txt and the default emotes.
+        """
+        if path in (self.responses_file, self.default_emotes_file):
+            return None
+        guild_id = os.path.basename(path)[:-4]
+        return int(guild_id) if guild_id.isdigit() else guild_id
+
+
+    @staticmethod
+    def _file_rules(files, path):
+        try:
+            return files[path][1]
+        except KeyError:
+            return ()
+
+
+    def _stamp(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+
+    def _load(self, path):
+        try:
+            with open(path, "r") as f:
+                return parse_rules(f.readlines())
+        except (OSError, UnicodeDecodeError):
+            log.warning("Could not load response rules from {}".format(path), exc_info=True)
+            return ()
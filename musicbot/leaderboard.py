@@ -0,0 +1,77 @@
+from bisect import bisect_left, insort
+
+class LeaderboardIndex:
+
+    """==========================================================================
+    Keeps one scoreboard's numeric scores in order, so leaderboards don't have to sort the whole board every time.
+    Entries are a sorted list of (-score, key): the best scores come first, and ties go by key.
+    Scorekeeper builds one of these the first time a board gets asked for a leaderboard, and keeps it updated from change_score.
+    Scores that aren't numbers (the odd string from &editscore) just aren't in the index.
+    =============================================================================
+    """
+
+    __slots__ = ("entries", "leader_cache")
+
+    def __init__(self, scoreboard={}):
+        self.entries = sorted((-score, key) for key, score in scoreboard.items() if key != "__saved__" and self.is_ranked(score))
+        self.leader_cache = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def is_ranked(score):
+        return isinstance(score, (int, float))
+
+    def update(self, key, old_score, new_score):
+        """
+        Moves key from old_score to new_score. Either can be None (or a non-number) for a key that's being added or dropped.
+        """
+        if self.leader_cache is not None: #the leaders only change if the top score gets reached (or left)
+            top_score = -self.entries[0][0] if self.entries else None
+            if top_score is None or (self.is_ranked(old_score) and old_score >= top_score) or (self.is_ranked(new_score) and new_score >= top_score):
+                self.leader_cache = None
+        if self.is_ranked(old_score):
+            i = bisect_left(self.entries, (-old_score, key))
+            if i < len(self.entries) and self.entries[i] == (-old_score, key):
+                del self.entries[i]
+        if self.is_ranked(new_score):
+            insort(self.entries, (-new_score, key))
+
+    def top(self, k, filter=None):
+        """
+        The k best (key, score)s, best first. If filter is given, only keys where filter(key) is true count.
+        Only looks at as many entries as it has to.
+        """
+        found = []
+        if k <= 0:
+            return found
+        for negative_score, key in self.entries:
+            if filter is not None and not filter(key):
+                continue
+            found.append((key, -negative_score))
+            if len(found) >= k:
+                break
+        return found
+
+    def leaders(self):
+        """
+        The keys tied for the top score, as a frozenset. Nobody leads with a score of 0.
+        Remembered until a change reaches the top score, so this is usually just a lookup.
+        """
+        if self.leader_cache is None:
+            leaders = []
+            if self.entries and self.entries[0][0] != 0:
+                top = self.entries[0][0]
+                for negative_score, key in self.entries:
+                    if negative_score != top:
+                        break
+                    leaders.append(key)
+            self.leader_cache = frozenset(leaders)
+        return self.leader_cache
+
+    def rank_of(self, score):
+        """
+        The rank a score would have: 1 plus the number of strictly better scores (so ties share a rank).
+        """
+        return bisect_left(self.entries, (-score,)) + 1
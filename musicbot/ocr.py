@@ -0,0 +1,152 @@
+"""
+Reads the text out of image attachments with tesseract, without blocking on_message.
+
+Images are read into memory and piped straight into tesseract's stdin (no shell, no temp files, nothing to rm
+afterwards). Jobs go through a bounded queue that a fixed number of workers drain, so a busy meme channel can only
+ever have a few tesseract processes going at once. When the queue is full, new images just don't get read.
+
+With an OCRCache, images that have been read before (by content hash) never make it to the queue at all.
+"""
+
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class OCRService:
+    """
+    A bounded queue of OCR jobs and the workers that run them. Everything gets started lazily on the first job
+    (so this can be made before the event loop exists).
+    """
+
+    def __init__(self, workers=2, max_queue=16, timeout=30, command="tesseract", cache=None):
+        """
+        workers is how many tesseract processes can run at once, max_queue how many jobs can wait for one,
+        and timeout how many seconds a job (every image of one message that isn't cached) gets before it's killed.
+        cache is an optional OCRCache.
+        """
+        self.cache = cache
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.command = command
+
+        self.queue = None
+        self.tasks = []
+        self.running = 0    #jobs a worker is currently on
+        self.completed = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.dropped = 0    #jobs turned away because the queue was full
+        self.cache_hits = 0 #images that didn't need reading
+
+    @property
+    def depth(self):
+        """
+        Jobs waiting for a worker plus the ones being worked on.
+        """
+        return (self.queue.qsize() if self.queue else 0) + self.running
+
+    def stats(self):
+        return {"queued": self.queue.qsize() if self.queue else 0, "running": self.running, "completed": self.completed,
+                "timeouts": self.timeouts, "failures": self.failures, "dropped": self.dropped, "cache_hits": self.cache_hits,
+                "cached": len(self.cache.texts) if self.cache else 0}
+
+    def _start(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.max_queue)
+            self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def read(self, images, message_id=None):
+        """
+        Reads the text out of a list of images (bytes), in order. Returns the text of all of them joined together,
+        or None if the queue was full, the job timed out, or tesseract couldn't be run.
+        With a cache, message_id gets recorded against the images so OCRCache.for_message can find them later.
+        """
+        if self.cache is None:
+            texts = await self._submit(images)
+            return None if texts is None else "".join(text or "" for text in texts)
+
+        digests = [self.cache.digest(image) for image in images]
+        texts = [self.cache.get(digest) for digest in digests]
+        missing = [i for i, text in enumerate(texts) if text is None]
+        self.cache_hits += len(images)-len(missing)
+        if missing:
+            read_texts = await self._submit([images[i] for i in missing])
+            if read_texts is None:
+                return None
+            for i, text in zip(missing, read_texts):
+                texts[i] = text
+                if text is not None: #failed reads don't get cached, they might work next time
+                    self.cache.put(digests[i], text)
+        if message_id is not None:
+            self.cache.remember_message(message_id, digests)
+        return "".join(text or "" for text in texts)
+
+    async def _submit(self, images):
+        """
+        Queues images for tesseract. Returns a list of texts (None for images tesseract choked on),
+        or None if the whole job didn't happen.
+        """
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((images, future))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            log.warning("OCR queue is full ({} jobs), skipping {} image(s)".format(self.depth, len(images)))
+            return None
+        return await future
+
+    async def _worker(self):
+        while True:
+            images, future = await self.queue.get()
+            self.running += 1
+            try:
+                text = await asyncio.wait_for(self._run_job(images), self.timeout)
+                self.completed += 1
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                log.warning("OCR job timed out after {}s ({} image(s), {} more in the queue)".format(self.timeout, len(images), self.queue.qsize()))
+                text = None
+            except Exception: #mostly tesseract not being installed. Either way, the worker has to keep going
+                self.failures += 1
+                log.error("OCR job failed ({})".format(self.command), exc_info=True)
+                text = None
+            finally:
+                self.running -= 1
+                self.queue.task_done()
+            if not future.done(): #the message handler might have given up on it
+                future.set_result(text)
+
+    async def _run_job(self, images):
+        output = []
+        for image in images:
+            output.append(await self._tesseract(image))
+        return output
+
+    async def _tesseract(self, image):
+        proc = await asyncio.create_subprocess_exec(
+            self.command, "stdin", "stdout",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL)
+        try:
+            stdout, _ = await proc.communicate(image)
+        except asyncio.CancelledError: #timed out (or shutting down), don't leave tesseract running
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+            raise
+        if proc.returncode != 0:
+            log.warning("{} exited with {}".format(self.command, proc.returncode))
+            return None
+        return stdout.decode(errors="replace")
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+class OCRCache:
+
+    """==========================================================================
+    Remembers what tesseract read out of every image, keyed by the SHA-256 of the image bytes,
+    so memes and reposts only ever get read once. Also remembers which images belong to which message
+    (so commands like &emojify can find the text of a message's images later on).
+    Both are least-recently-used caches with a fixed number of entries.
+    When OCRCache.is_saved==False, the cache in memory no longer matches the version saved to disk.
+    Lives in misc_data (not image_cache) so it survives the nightly clean_image_cache.
+    The bot saves it once a minute (and on shutdown) with snapshot() on the event loop and write() on a worker thread.
+    =============================================================================
+    """
+
+    VERSION = 1
+
+    def __init__(self, path=os.path.abspath("misc_data/ocr_cache.json"), max_images=2000, max_messages=2000):
+        self.path = path
+        self.max_images = max_images
+        self.max_messages = max_messages
+        self.texts = OrderedDict()      #digest -> text, least recently used first
+        self.messages = OrderedDict()   #message id (str) -> list of digests
+        self.is_saved = True
+        self.load()
+
+    @staticmethod
+    def digest(image):
+        """
+        The cache key of an image (bytes).
+        """
+        return hashlib.sha256(image).hexdigest()
+
+    def get(self, digest):
+        """
+        Returns the text read from the image with the given digest, or None if it isn't cached.
+        """
+        text = self.texts.get(digest)
+        if text is not None:
+            self.texts.move_to_end(digest)
+        return text
+
+    def put(self, digest, text):
+        self.texts[digest] = text
+        self.texts.move_to_end(digest)
+        while len(self.texts) > self.max_images:
+            self.texts.popitem(last=False)
+        self.is_saved = False
+
+    def remember_message(self, message_id, digests):
+        """
+        Records which images (by digest, in order) were attached to a message.
+        """
+        key = str(message_id)
+        self.messages[key] = list(digests)
+        self.messages.move_to_end(key)
+        while len(self.messages) > self.max_messages:
+            self.messages.popitem(last=False)
+        self.is_saved = False
+
+    def for_message(self, message_id):
+        """
+        Returns the text of all of a message's images joined together, or None if any of them aren't cached anymore.
+        """
+        digests = self.messages.get(str(message_id))
+        if digests is None:
+            return None
+        texts = [self.get(digest) for digest in digests]
+        if any(text is None for text in texts):
+            return None
+        return "".join(texts)
+
+    def load(self):
+        """
+        Loads the cache from disk. A missing or unreadable file just means an empty cache.
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") != self.VERSION:
+                raise ValueError("Unknown OCR cache version: "+str(data.get("version")))
+            self.texts = OrderedDict((digest, text) for digest, text in data["texts"])
+            self.messages = OrderedDict((key, digests) for key, digests in data["messages"])
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError):
+            print("Couldn't read the OCR cache at "+self.path+", starting a new one")
+        self.is_saved = True
+
+    def save(self):
+        """
+        Saves the cache to disk (through a temp file, so a crash mid-save can't leave half a cache behind).
+        """
+        self.write(self.snapshot())
+
+    def snapshot(self):
+        """
+        Copies the cache into what write() needs and marks it as saved. This part is quick, so it can happen on the event loop
+        and the slow write() can go to another thread without the cache changing under it.
+        """
+        data = {"version": self.VERSION, "texts": list(self.texts.items()), "messages": list(self.messages.items())}
+        self.is_saved = True
+        return data
+
+    def write(self, data):
+        """
+        Writes a snapshot() to disk.
+        """
+        temp_path = self.path+".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
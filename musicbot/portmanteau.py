@@ -0,0 +1,141 @@
+"""
+Portmanteaus and portmanthrees. Plain functions with no bot state, so they can run in the analysis pool (see analysis.py).
+
+Word pairs get memoized (the same two or three word messages come up over and over in chat), and the
+PORTMANTEAU_EXCLUDES list is parsed once into hash sets instead of being re-split for every message.
+"""
+
+import re
+import random
+from functools import lru_cache
+
+LEADING_VOWEL = re.compile(r'^[aeiou]', re.IGNORECASE)
+PATTERN = re.compile(r'(\w*?)([aeiou]\w*)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def portmanteau(first, second):
+    """combines two words into one word - written by Katie"""
+
+    # Error check: The function won't take words that are too short (1 letter).
+    if (len(first) < 2 or len(second) < 2):
+        #print("Arguments not long enough!")
+        return ""
+                           
+    # Error check: The first word can't start with a vowel.
+    if (LEADING_VOWEL.match(first)):
+        #print("First word can't start with vowel!")
+        return ""
+                                              
+    # Error check: Both words must actually have vowels in them for this to actually work.
+    first_match = PATTERN.match(first)
+    second_match = PATTERN.match(second)
+    if not (first_match and second_match):
+        #print("No vowels found!")
+        return ""
+                                                                        
+    port = first_match.group(1)
+    manteau = second_match.group(2)
+                                                                                
+    return (port + manteau)
+    #combines two words into one word
+
+
+def portmanteau_old(first, second):
+    """Older version of portmanteau - Ignores the letter Y. Raises exceptions instead of returning empty string"""
+    leading_vowel = re.compile(r'^[aeiou]', re.IGNORECASE)
+    pattern = re.compile(r'(\w+?)([aeiou]\w*)', re.IGNORECASE)
+    if (len(first) < 2 or len(second) < 2):
+        return None
+    if (leading_vowel.match(first)):
+        return None
+    if not (pattern.match(first) and pattern.match(second)):
+        return None
+    port = pattern.match(first).group(1)
+    manteau = pattern.match(second).group(2)
+    return (port + manteau)
+
+
+class ExclusionIndex:
+    """
+    The PORTMANTEAU_EXCLUDES list ("firstword;;secondword" strings, * is a wild card) split up into hash sets by which side is a wild card.
+    """
+    __slots__ = ("exact", "any_second", "any_first", "everything")
+
+    def __init__(self, excludes):
+        self.exact = set()          #(first, second)
+        self.any_second = set()     #first;;*
+        self.any_first = set()      #*;;second
+        self.everything = False     #*;;*
+        for pair in excludes:
+            if not ";;" in pair:
+                print("Ignoring a portmanteau exclude without a ;; in it: "+pair)
+                continue
+            first, second = pair.split(";;",1)
+            if first=="*" and second=="*":
+                self.everything = True
+            elif second=="*":
+                self.any_second.add(first)
+            elif first=="*":
+                self.any_first.add(second)
+            else:
+                self.exact.add((first, second))
+
+    def excludes(self, first, second):
+        first, second = first.lower(), second.lower()
+        return self.everything or first in self.any_second or second in self.any_first or (first, second) in self.exact
+
+
+@lru_cache(maxsize=8)
+def exclusion_index(excludes):
+    """
+    The ExclusionIndex for a tuple of exclude strings. Cached, so it only gets built again when the configs change.
+    """
+    return ExclusionIndex(excludes)
+
+
+def portmanthree(first, second, third, excludes, rng=random):
+    """Combines two of three words using the portmanteau method - Written by Kate"""
+    options = []
+    words = [first,second,third]
+    index = exclusion_index(tuple(excludes))
+    try:
+        port12 = portmanteau(first,second)
+        if not port12 in words and port12.strip() and not index.excludes(first, second):
+            options.append(port12+" "+third)
+    except (AttributeError,IndexError):
+        print("There was an error in portmanthree on 23 of: "+" ".join(words))
+    
+    try:
+        port23 = portmanteau(second,third)
+        if not port23 in words and port23.strip() and not index.excludes(second, third):
+            options.append(first+" "+port23)
+    except (AttributeError,IndexError):
+        print("There was an error in portmanthree on 23 of: "+" ".join(words))
+
+    #These are options I decided to leave out
+    #options.append(portmanteau(first,portmanteau(second,third)))
+    #options.append(portmanteau(portmanteau(first,second),third))
+
+    if len(options)>0:
+        return rng.choice(options)
+    return None
+
+
+def combine(words, excludes, rng=random):
+    """
+    The on_message portmanteau responder: a portmanteau for two words, or (half the time, so it's less spammy)
+    a portmanthree for three. Returns (combo_word, delete_after), or None when there's nothing to say.
+    """
+    if len(words)==2:
+        if exclusion_index(tuple(excludes)).excludes(words[0], words[1]):
+            return None
+        combo_word = portmanteau(words[0], words[1])
+        if not (combo_word == words[0] or combo_word == words[1]) and combo_word.strip():
+            return (combo_word, 15)
+
+    elif len(words)==3 and rng.random()<0.5: #Excludes are applied to portmanthrees in portmanthree
+        combo_word = portmanthree(words[0], words[1], words[2], excludes, rng)
+        if combo_word:
+            return (combo_word, 10)
+    return None
@@ -1,5 +1,10 @@
 import os
 import json
+import threading
+import traceback
+
+from .leaderboard import LeaderboardIndex
+from .array_board import ArrayBoard
 
 class Scorekeeper:
 
@@ -10,20 +15,51 @@ class Scorekeeper:
     All scoreboards reserve the "__saved__" key to mark whether or not the individual scoreboard matches the version on disk.
     When Scorekeeper.is_saved==False, at least one of the scoreboards in memory no longer matches the version saved to disk.
     Use Scorekeeper.save() and Scorekeeper.load() to save and load contents to and from the disk as necessary.
-    Sorting, getting top scores, and all that junk must be done externally.
+    (sqlite_scorekeeper.py has a drop-in SQLite version of this, picked with SCOREBOARD_BACKEND in custom_configs.txt)
+    Use Scorekeeper.top() and Scorekeeper.rank_of() for leaderboards. Those keep a sorted index of each board they get used on
+    (see leaderboard.py), so they never have to sort a whole board. Groups of keys (like the members of a guild) get their own
+    indexes too, so a guild's leaderboard never has to look at anyone outside the guild.
+
+    Updated 2026 with a write-ahead log: every change gets appended to scores.log as one small json line
+    (["board", "key", new value], or lists of keys and values for bulk changes) instead of rewriting the whole board file, and load() replays the log on top of the
+    board files. Every now and then the log gets compacted: the changed boards are rewritten and the log starts over.
+    With start_writer(), all of that happens on a background thread: changing a score just queues a log line, and the
+    writer flushes whatever has piled up at most once every few seconds (everything gets fsynced, and boards go through temp files).
+    Boards that get reset every so often (like the daily ones) use set_generation(): each generation is its own board
+    (goku_attempts@2026-10-18), so resetting is one small change. The old generation is dropped from memory right away, and its file goes at the next compaction.
+    With compact=True, boards are kept as ArrayBoards (see array_board.py) instead of dicts: same interface, a lot less memory
+    for boards with lots of user ids, and the board doubles as its own leaderboard index.
     =============================================================================
     """
 
     default_path=os.path.abspath("misc_data/scoreboards/")+"/"
+    LOG_FILE = "scores.log"
+    COMPACTING_LOG_FILE = "scores.compacting.log" #the old log while a compaction is writing the boards. Replayed if the bot died halfway through
+    GENERATIONS_BOARD = "__generations__" #scoreboard name -> its current generation, for the boards that use set_generation()
 
-    def __init__(self, default_path=os.path.abspath("misc_data/scoreboards/")+"/"):
+    def __init__(self, default_path=os.path.abspath("misc_data/scoreboards/")+"/", compact_after=256*1024, compact=False):
         """
         Loads all scoreboards from the default_path directory.
         Uses the default default_path if not specified.
+        compact_after is how big (in bytes) the log can get before needs_compaction() says it's time.
+        If compact=True, scoreboards are stored as ArrayBoards instead of dicts.
         """
         #print("INITING")
         self.default_path = default_path
+        self.compact_after = compact_after
+        self.compact = compact
         self.scoreboards = {}
+        self.pending = []   #log lines that haven't been written yet
+        self.removed = set() #boards whose .json files get deleted at the next compaction
+        self.stale = set()   #old generations of boards found by load(), thrown out at the next compaction
+        self.indexes = {}   #(scoreboard name, group or None) -> LeaderboardIndex, made the first time a board gets ranked
+        self.groups = {}    #group (like a guild id) -> set of keys
+        self.key_groups = {} #key -> set of the groups it's in
+        self.lock = threading.RLock()       #guards the scoreboards and pending against the writer thread
+        self.write_lock = threading.RLock() #only one save/compaction at a time
+        self.writer = None
+        self.wake = threading.Event()       #set whenever there's something new to save
+        self.stopping = threading.Event()
         self.load()
         #print(self.scoreboards)
         #print("DONE")
@@ -47,40 +83,107 @@ class Scorekeeper:
             except:
                 raise TypeError("The passed-in value is not additive (type: "+str(type(value))+"). It cannot be used when increment=True")
 
-        key = str(key)
-        #reserved __saved__ marker
-        if key == "__saved__":
-            raise ValueError("The __saved__ key is reserved, and should not be modified this way.")
-
-        try: #get the scoreboard dict
-            scoreboard = self.scoreboards[scoreboard_name]
-        except KeyError: #scoreboard does not exist yet - create a new one with the new value
-            scoreboard = self.add_scoreboard(scoreboard_name, new_scoreboard={key:value})
-            return value
-
-        try: #get the old_score and overwrite/increment as needed
-            old_score = scoreboard[key]
-
-            if increment: #try to increment
-                try:
-                    new_score = old_score+value
-                except:
-                    raise TypeError("The given value (type: "+str(type(value))+") could not be added to the original value (type: "+str(type(old_score))+") (incompatable types probably)")
-            else:
+        with self.lock: #the writer thread might be taking a snapshot
+            scoreboard_name = self._board_name(scoreboard_name)
+            key = str(key)
+            #reserved __saved__ marker
+            if key == "__saved__":
+                raise ValueError("The __saved__ key is reserved, and should not be modified this way.")
+
+            try: #get the scoreboard dict
+                scoreboard = self.scoreboards[scoreboard_name]
+            except KeyError: #scoreboard does not exist yet - create a new one with the new value
+                scoreboard = self.add_scoreboard(scoreboard_name, new_scoreboard={key:value})
+                return value
+
+            try: #get the old_score and overwrite/increment as needed
+                old_score = scoreboard[key]
+
+                if increment: #try to increment
+                    try:
+                        new_score = old_score+value
+                    except:
+                        raise TypeError("The given value (type: "+str(type(value))+") could not be added to the original value (type: "+str(type(old_score))+") (incompatable types probably)")
+                else:
+                    new_score = value
+
+                if old_score != new_score: #Dont bother saving if nothing has changed
+                    scoreboard[key]=new_score
+                    scoreboard["__saved__"]=0
+                    self._log_change(scoreboard_name, key, new_score)
+                    self._reindex(scoreboard_name, key, old_score, new_score)
+
+            except KeyError: #the given key has no current score - create the new score
                 new_score = value
-
-            if old_score != new_score: #Dont bother saving if nothing has changed
                 scoreboard[key]=new_score
                 scoreboard["__saved__"]=0
-                self.is_saved = False
+                self._log_change(scoreboard_name, key, new_score)
+                self._reindex(scoreboard_name, key, None, new_score)
+            return new_score
+        
+
+    def change_scores_bulk(self, scoreboard_name, keys, value=1, increment=True):
+        """
+        change_score for a bunch of keys at once, all with the same value. It's all one change (one log line, one dirty mark),
+        so it's much cheaper than calling change_score in a loop.
+        Raises TypeError like change_score does, in which case none of the scores get changed.
+        """
+        if increment:
+            try:
+                testvalue = value+value
+            except:
+                raise TypeError("The passed-in value is not additive (type: "+str(type(value))+"). It cannot be used when increment=True")
 
-        except KeyError: #the given key has no current score - create the new score
-            new_score = value
-            scoreboard[key]=new_score
+        with self.lock:
+            scoreboard_name = self._board_name(scoreboard_name)
+            keys = [str(key) for key in keys]
+            if "__saved__" in keys:
+                raise ValueError("The __saved__ key is reserved, and should not be modified this way.")
+            scoreboard = self.scoreboards.get(scoreboard_name)
+            if scoreboard is None:
+                self.add_scoreboard(scoreboard_name, new_scoreboard=dict.fromkeys(keys, value))
+                return
+
+            new_scores = {}
+            for key in keys: #work everything out first, so a bad score can't leave the board half changed
+                old_score = scoreboard.get(key)
+                if old_score is None or not increment:
+                    new_score = value
+                else:
+                    try:
+                        new_score = old_score+value
+                    except:
+                        raise TypeError("The given value (type: "+str(type(value))+") could not be added to the original value (type: "+str(type(old_score))+") (incompatable types probably)")
+                if old_score != new_score:
+                    new_scores[key] = (old_score, new_score)
+            if not new_scores:
+                return
+
+            for key, (old_score, new_score) in new_scores.items():
+                scoreboard[key] = new_score
+                self._reindex(scoreboard_name, key, old_score, new_score)
             scoreboard["__saved__"]=0
-            self.is_saved = False
-        return new_score
-        
+            self._log_change(scoreboard_name, list(new_scores), [new_score for _, new_score in new_scores.values()]) #a list of keys goes with a list of values
+
+
+    def mark_group(self, scoreboard_name, group, value=1):
+        """
+        Marks a whole group (like all the members of a guild) on a yes/no kind of scoreboard in one go, by setting the group's own score.
+        Check it with is_marked().
+        """
+        return self.change_score(str(group), scoreboard_name, value=value, increment=False)
+
+
+    def is_marked(self, scoreboard_name, key):
+        """
+        True if key has a score on the scoreboard (that isn't 0), or any group it's in does (see mark_group).
+        """
+        scoreboard = self.scoreboards.get(self._board_name(scoreboard_name))
+        if not scoreboard:
+            return False
+        key = str(key)
+        return bool(scoreboard.get(key)) or any(scoreboard.get(group) for group in self.key_groups.get(key, ()))
+
 
     def set_score(self, key, scoreboard_name, value):
         """
@@ -102,7 +205,7 @@ class Scorekeeper:
             raise ValueError("The __saved__ key is reserved, and should not be accessed this way.")
 
         try:
-            scoreboard = self.scoreboards[scoreboard_name]
+            scoreboard = self.scoreboards[self._board_name(scoreboard_name)]
             return scoreboard[key]
         except KeyError:
             return None if show_none else 0
@@ -115,7 +218,7 @@ class Scorekeeper:
         Inportant Note - External processing should not modify the scoreboard in any way as it will not properly update the "is saved" markers for the scoreboard.
         """
         try:
-            return self.scoreboards[scoreboard_name]
+            return self.scoreboards[self._board_name(scoreboard_name)]
         except KeyError:
             return None if show_none else {}
 
@@ -129,68 +232,503 @@ class Scorekeeper:
         """
 
         #print("+ADDING SCOREBOARD: "+scoreboard_name)
-        try:
+        with self.lock:
+            scoreboard_name = self._board_name(scoreboard_name)
+            self._drop_indexes(scoreboard_name) #gets rebuilt the next time it's needed
+            try:
+                board = self.scoreboards[scoreboard_name]
+                if not overwrite:
+                    raise ValueError("That scoreboard already exists! Cannot add it without overwriting the existing one: "+scoreboard_name)
+                #print("OVERWRITING")
+                board.clear()
+                board["__saved__"]=0
+                board.update(new_scoreboard)
+                returned = board
+            except KeyError:
+                #print("HERE")
+                #print("++CURRENTLY: "+str(new_scoreboard))
+                board = self._new_board(new_scoreboard)
+                board["__saved__"]=0
+                self.scoreboards[scoreboard_name]=board
+                #print(self.scoreboards[scoreboard_name])
+                returned = board
+            self._log_change(scoreboard_name, None, {k:v for k,v in returned.items() if k!="__saved__"}) #a None key replaces the whole board
+            #print("++RETURNING: "+str(returned))
+            return returned
+
+
+    def remove_scoreboard(self, scoreboard_name, path=None):
+        """
+        Deletes a scoreboard entirely. Does nothing if it doesn't exist.
+        The removal is logged like any other change, and the .json file goes away at the next compaction
+        (deleting it right away could race with a compaction that's still writing it).
+        """
+        with self.lock:
+            scoreboard_name = self._board_name(scoreboard_name)
+            self._drop_indexes(scoreboard_name)
+            if self.scoreboards.pop(scoreboard_name, None) is None:
+                return
+            self._log_change(scoreboard_name, None, None) #a None key and value removes the board, so older changes in the log can't bring it back
+            self.removed.add(scoreboard_name)
+
+
+    def total(self, scoreboard_name):
+        """
+        Returns the sum of every numeric score on a scoreboard (0 if it doesn't exist).
+        """
+        board = self.scoreboards.get(self._board_name(scoreboard_name))
+        if board is None:
+            return 0
+        if isinstance(board, ArrayBoard):
+            return board.total()
+        return sum(score for key, score in board.items() if key != "__saved__" and LeaderboardIndex.is_ranked(score))
+
+
+    def top(self, scoreboard_name, k, filter=None, group=None):
+        """
+        Returns the k highest (key, score)s of a scoreboard as a list, highest first. Ties go by key.
+        If group is specified, only the keys in that group are counted (see set_group), which only ever looks at the group's own scores.
+        If filter is specified, only keys where filter(key) is True are counted.
+        Only numeric scores are ranked. Returns an empty list if the scoreboard doesn't exist.
+        """
+        index = self._index(self._board_name(scoreboard_name), group)
+        return index.top(k, filter) if index else []
+
+
+    def leaders(self, scoreboard_name, group=None):
+        """
+        Returns the keys tied for the top score of a scoreboard (or of just a group's keys) as a frozenset.
+        Empty if the scoreboard doesn't exist or the top score is 0. Cached until a change reaches the top score, so it's cheap to call a lot.
+        """
+        index = self._index(self._board_name(scoreboard_name), group)
+        return index.leaders() if index else frozenset()
+
+
+    def rank_of(self, scoreboard_name, key, group=None):
+        """
+        Returns key's rank on a scoreboard (1 is the top, and ties share a rank), or None if it has no numeric score there.
+        If group is specified, the rank is among that group only (and None if key isn't in it).
+        """
+        key = str(key)
+        if group is not None and key not in self.groups.get(str(group), ()):
+            return None
+        scoreboard_name = self._board_name(scoreboard_name)
+        index = self._index(scoreboard_name, group)
+        score = self.get_score(key, scoreboard_name)
+        if not index or not LeaderboardIndex.is_ranked(score):
+            return None
+        return index.rank_of(score)
+
+
+    def set_generation(self, scoreboard_name, generation):
+        """
+        Starts a new generation of a scoreboard that gets reset every so often (like the daily goku attempts):
+        from now on, scoreboard_name means a fresh board that's stored as scoreboard_name@generation (generation is a string, like the date).
+        The old generation is dropped right away (like remove_scoreboard, so it's one log line no matter how big it was),
+        and its .json goes at the next compaction.
+        """
+        with self.lock:
+            old_name = self._board_name(scoreboard_name)
+            self.change_score(scoreboard_name, self.GENERATIONS_BOARD, str(generation), increment=False)
+            if self._board_name(scoreboard_name) != old_name:
+                self._drop_indexes(old_name)
+                if self.scoreboards.pop(old_name, None) is not None:
+                    self._log_change(old_name, None, None)
+                self.removed.add(old_name)
+
+
+    def _board_name(self, scoreboard_name):
+        """
+        What a scoreboard is actually stored as: its current generation if it has them, otherwise just its name.
+        """
+        generation = self.scoreboards.get(self.GENERATIONS_BOARD, {}).get(scoreboard_name)
+        return scoreboard_name if generation is None or scoreboard_name=="__saved__" else scoreboard_name+"@"+generation
+
+
+    def _find_stale(self):
+        """
+        Marks every generation of a generational board that isn't the current one as stale.
+        set_generation() drops the old ones itself, so these are only ever left over from before it did.
+        """
+        for name in self.scoreboards.get(self.GENERATIONS_BOARD, {}):
+            if name == "__saved__":
+                continue
+            current = self._board_name(name)
+            for board_name in self.scoreboards:
+                if board_name != current and (board_name == name or board_name.startswith(name+"@")):
+                    self.stale.add(board_name)
+
+
+    def set_group(self, group, keys):
+        """
+        Sets (or replaces) the keys in a group, like the members of a guild. Groups get their own leaderboard views
+        (made the first time top() or rank_of() asks for them), which stay up to date as scores and the group change.
+        Groups only live in memory - they're not saved.
+        """
+        group = str(group)
+        self.remove_group(group)
+        members = self.groups[group] = set(str(key) for key in keys)
+        for key in members:
+            self.key_groups.setdefault(key, set()).add(group)
+
+
+    def join_group(self, group, key):
+        """
+        Adds a key to a group (and to the group's leaderboard views).
+        """
+        group, key = str(group), str(key)
+        members = self.groups.setdefault(group, set())
+        if key in members:
+            return
+        members.add(key)
+        self.key_groups.setdefault(key, set()).add(group)
+        for (scoreboard_name, view_group), index in self.indexes.items():
+            if view_group == group:
+                index.update(key, None, self.get_score(key, scoreboard_name))
+
+
+    def leave_group(self, group, key):
+        """
+        Takes a key out of a group (and out of the group's leaderboard views).
+        """
+        group, key = str(group), str(key)
+        members = self.groups.get(group)
+        if not members or key not in members:
+            return
+        members.discard(key)
+        self.key_groups[key].discard(group)
+        if not self.key_groups[key]:
+            del self.key_groups[key]
+        for (scoreboard_name, view_group), index in self.indexes.items():
+            if view_group == group:
+                index.update(key, self.get_score(key, scoreboard_name), None)
+
+
+    def remove_group(self, group):
+        group = str(group)
+        for key in self.groups.pop(group, ()):
+            self.key_groups[key].discard(group)
+            if not self.key_groups[key]:
+                del self.key_groups[key]
+        for view in [view for view in self.indexes if view[1] == group]:
+            del self.indexes[view]
+
+
+    def _index(self, scoreboard_name, group=None):
+        """
+        The LeaderboardIndex of a scoreboard, or of just the keys in a group (made on the spot if it doesn't have one yet).
+        An ArrayBoard is its own index for the whole board.
+        None if the scoreboard or group doesn't exist.
+        """
+        group = None if group is None else str(group)
+        if group is None and isinstance(self.scoreboards.get(scoreboard_name), ArrayBoard):
+            return self.scoreboards[scoreboard_name]
+        index = self.indexes.get((scoreboard_name, group))
+        if index is None and scoreboard_name in self.scoreboards:
             board = self.scoreboards[scoreboard_name]
-            if not overwrite:
-                raise ValueError("That scoreboard already exists! Cannot add it without overwriting the existing one: "+scoreboard_name)
-            #print("OVERWRITING")
-            board.clear()
-            board["__saved__"]=0
-            board.update(new_scoreboard)
-            self.is_saved = False
-            returned = board
-        except KeyError:
-            #print("HERE")
-            #print("++CURRENTLY: "+str(new_scoreboard))
-            new_scoreboard["__saved__"]=0
-            self.scoreboards[scoreboard_name]=new_scoreboard
-            self.is_saved = False
-            #print(self.scoreboards[scoreboard_name])
-            returned = new_scoreboard
-        #print("++RETURNING: "+str(returned))
-        return returned
+            if group is None:
+                index = LeaderboardIndex(board)
+            elif group in self.groups:
+                index = LeaderboardIndex({key: board[key] for key in self.groups[group] if key in board})
+            else:
+                return None
+            self.indexes[(scoreboard_name, group)] = index
+        return index
+
+
+    def _reindex(self, scoreboard_name, key, old_score, new_score):
+        for group in [None, *self.key_groups.get(key, ())]:
+            index = self.indexes.get((scoreboard_name, group))
+            if index is not None:
+                index.update(key, old_score, new_score)
+
+
+    def _drop_indexes(self, scoreboard_name):
+        for view in [view for view in self.indexes if view[0] == scoreboard_name]:
+            del self.indexes[view]
 
 
-    def save(self, path=default_path, force_all=False):
+    def _new_board(self, contents):
         """
-        Runs through all the scoreboard dicitonaries in memory and saves them as .jsons to the specified path (uses defualt_path if unspecified).
-        Only saves the scoreboards tagged as updated/unsaved ("__saved__" : 0) to save on write time.
-        Will overwrite any old scoreboard files in the process.
+        contents as whatever kind of board this Scorekeeper uses: an ArrayBoard if compact, otherwise the dict itself.
         """
+        return ArrayBoard(contents) if self.compact else contents
+
+
+    def _log_change(self, scoreboard_name, key, value):
+        self.pending.append(json.dumps([scoreboard_name, key, value], separators=(",",":"))+"\n")
+        self.wake.set()
+
+
+    @property
+    def is_saved(self):
+        """
+        False while there are changes that haven't been written to the log yet.
+        """
+        return not self.pending
+
+
+    def save(self, path=None, force_all=False):
+        """
+        Appends all the changes made since the last save to the log in the specified path (uses the default_path the Scorekeeper was made with if unspecified).
+        That's one small write per change, no matter how big the boards are.
+        If force_all=True, also compacts: every scoreboard gets rewritten as a .json and the log starts over.
+        Safe to call from any thread (like with asyncio.to_thread), even with the writer running.
+        """
+        path = path if path else self.default_path
         #print("=SAVING")
+        with self.write_lock:
+            with self.lock:
+                lines, self.pending = self.pending, []
+            if lines:
+                try:
+                    with open(path+self.LOG_FILE, "a") as f:
+                        f.writelines(lines)
+                        f.flush()
+                        os.fsync(f.fileno())
+                except:
+                    with self.lock: #put them back for the next save. Some might end up in the log twice, which replay doesn't mind
+                        self.pending[:0] = lines
+                    print("Couldn't write the scoreboard log, these will be retried at the next save: "+", ".join(sorted({json.loads(line)[0] for line in lines})))
+                    raise
+            if force_all:
+                self.write_compaction(self.start_compaction(path, force_all=True))
 
-        boards = [(k,v) for k,v in self.scoreboards.items()] #convert into list of tuples for iterating
-        if not force_all:
-            boards = list(filter(lambda x: x[1].get("__saved__")==0 or not x[1].get("__saved__"), boards)) #filter out boards that don't need saving
 
-        for board in boards:
-            #print("==SAVING: "+board[0]+" : "+str(board[1]))
-            with open(path+board[0]+".json", "w") as f:
-                json.dump(board[1], f)
-            board[1]["__saved__"]=1 #mark as saved
-        self.is_saved = True
+    def flush(self, path=None):
+        """
+        Saves, and compacts too if the log has gotten big. This is what the writer thread runs.
+        """
+        with self.write_lock:
+            self.save(path)
+            if self.needs_compaction(path):
+                self.write_compaction(self.start_compaction(path))
 
 
-    def load(self, path=default_path, clear_old=True):
+    def start_writer(self, interval=5):
+        """
+        Starts the background thread that saves the scoreboards, so nothing but queueing log lines happens wherever the scores change.
+        After a change, the writer waits interval seconds (so a burst of changes becomes one write) and then flushes.
         """
-        Loads all .jsons in the specified path (uses default_path if unspecified) into memory.
+        if self.writer is not None:
+            return
+        self.save_interval = interval
+        self.stopping.clear()
+        self.writer = threading.Thread(target=self._write_loop, name="Scorekeeper writer", daemon=True)
+        self.writer.start()
+
+
+    def stop_writer(self):
+        """
+        Stops the writer thread (if it's running) and saves whatever it hadn't gotten to yet.
+        """
+        if self.writer is not None:
+            self.stopping.set()
+            self.wake.set()
+            self.writer.join()
+            self.writer = None
+        self.flush()
+
+
+    def _write_loop(self):
+        while True:
+            self.wake.wait()
+            if self.stopping.wait(self.save_interval): #let the changes pile up for a bit. stop_writer() does the last flush itself
+                return
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception: #a full disk or something. save() and write_compaction() put back whatever didn't make it (and say which boards), so the next try redoes it
+                print("Couldn't save the scoreboards, trying again in "+str(self.save_interval)+" seconds")
+                traceback.print_exc()
+                self.wake.set()
+
+
+    def needs_compaction(self, path=None):
+        """
+        True once the log has grown past compact_after bytes, or if there's a compaction that didn't finish
+        (its log is still around, and it only goes away once every board it covers is written).
+        """
+        path = path if path else self.default_path
+        if os.path.isfile(path+self.COMPACTING_LOG_FILE):
+            return True
+        try:
+            return os.path.getsize(path+self.LOG_FILE) > self.compact_after
+        except FileNotFoundError:
+            return False
+
+
+    def start_compaction(self, path=None, force_all=False):
+        """
+        First half of a compaction. Saves, copies the unsaved boards (or all of them if force_all=True),
+        and moves the log aside so new changes go to a fresh one.
+        Returns the snapshot to hand to write_compaction(). Both halves are safe to run on another thread.
+        """
+        path = path if path else self.default_path
+        with self.write_lock:
+            self.save(path)
+            boards = {}
+            with self.lock: #just copies, the json happens in write_compaction()
+                for name, board in self.scoreboards.items():
+                    if force_all or board.get("__saved__")==0 or not board.get("__saved__"):
+                        board["__saved__"]=1 #mark as saved
+                        boards[name] = board.copy() #works for a dict or an ArrayBoard
+                for name in self.stale: #old generations
+                    if self.scoreboards.pop(name, None) is not None:
+                        self._log_change(name, None, None)
+                    self.removed.add(name)
+                self.stale.clear()
+                for name in self.removed:
+                    if name not in self.scoreboards: #unless it got made again since
+                        boards[name] = None
+                self.removed.clear()
+            if os.path.isfile(path+self.LOG_FILE):
+                if os.path.isfile(path+self.COMPACTING_LOG_FILE): #a compaction that never finished. Keep its changes too
+                    with open(path+self.LOG_FILE, "r") as f:
+                        newer = f.read()
+                    with open(path+self.COMPACTING_LOG_FILE, "a") as f:
+                        f.write(newer)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.remove(path+self.LOG_FILE)
+                else:
+                    os.replace(path+self.LOG_FILE, path+self.COMPACTING_LOG_FILE)
+        return (path, boards)
+
+
+    def write_compaction(self, snapshot):
+        """
+        Second half of a compaction: writes the boards from start_compaction() (each through an fsynced temp file), deletes the removed ones,
+        and then drops the old log.
+        If anything goes wrong, every board in the snapshot is marked unsaved again (and the removed ones go back in removed),
+        the old log is kept, and the exception is raised. The next compaction (which needs_compaction() asks for right away) redoes them.
+        """
+        path, boards = snapshot
+        with self.write_lock:
+            try:
+                for name, board in boards.items():
+                    if board is None:
+                        if os.path.isfile(path+name+".json"):
+                            os.remove(path+name+".json")
+                        continue
+                    #print("==SAVING: "+name)
+                    try:
+                        with open(path+name+".json.tmp", "w") as f:
+                            json.dump(dict(board.items()), f)
+                            f.flush()
+                            os.fsync(f.fileno())
+                        os.replace(path+name+".json.tmp", path+name+".json")
+                    except:
+                        try: #don't leave half a board lying around
+                            os.remove(path+name+".json.tmp")
+                        except OSError:
+                            pass
+                        raise
+                self._fsync_dir(path) #the renames have to be on disk before the log that covers them goes away
+            except:
+                self._unsave(boards)
+                print("Couldn't compact the scoreboards, these will be rewritten at the next compaction: "+", ".join(sorted(boards)))
+                raise
+            if os.path.isfile(path+self.COMPACTING_LOG_FILE):
+                os.remove(path+self.COMPACTING_LOG_FILE)
+
+
+    def _unsave(self, boards):
+        """
+        Undoes what start_compaction() marked as saved, for a compaction that didn't make it to disk.
+        """
+        with self.lock:
+            for name, board in boards.items():
+                if board is None:
+                    if name not in self.scoreboards:
+                        self.removed.add(name)
+                elif name in self.scoreboards:
+                    self.scoreboards[name]["__saved__"]=0
+
+
+    @staticmethod
+    def _fsync_dir(path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError: #windows can't open directories
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+    def load(self, path=None, clear_old=True):
+        """
+        Loads all .jsons in the specified path (uses the default_path the Scorekeeper was made with if unspecified) into memory, then replays the log on top of them.
         If clear_old=True, the current scoreboards will be flushed beforehand.
         If clear_old=False, only those scoreboards in memory with names matching the json files will be overwritten.
+        Anything that hasn't been saved yet is lost.
         """
+        path = path if path else self.default_path
         #print("#LOADING")
-        if clear_old:
-            self.scoreboards.clear()
-        file_list = os.listdir(path)
-        for file in file_list:
-            if not file.endswith(".json") or file.startswith("."): #ignore hidden files and non-jsons
+        with self.write_lock, self.lock:
+            self.pending.clear()
+            self.removed.clear()
+            self.stale.clear()
+            self.indexes.clear()
+            if clear_old:
+                self.scoreboards.clear()
+            file_list = os.listdir(path)
+            for file in file_list:
+                if not file.endswith(".json") or file.startswith("."): #ignore hidden files and non-jsons
+                    continue
+                #print("##LOADING FILE: "+file)
+                with open(path+file, "r") as f:
+                    board = self._new_board(json.load(f))
+                board["__saved__"]=1
+                self.scoreboards[file[:-5]] = board
+
+            for log_file in (self.COMPACTING_LOG_FILE, self.LOG_FILE): #oldest changes first
+                self._replay(path+log_file)
+            self.pending.clear() #replaying doesn't need to be logged again
+            self._find_stale()
+
+
+    def _replay(self, log_path):
+        """
+        Applies every change in a log file. Changes are stored as the new values, so replaying twice does no harm.
+        """
+        try:
+            with open(log_path, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                scoreboard_name, key, value = json.loads(line)
+            except (ValueError, TypeError): #a line that got cut off when the bot died
+                print("Skipping a broken line in "+log_path)
                 continue
-            #print("##LOADING FILE: "+file)
-            with open(path+file, "r") as f:
-                board = json.load(f)
-
-            loaded = self.add_scoreboard(file[:-5], new_scoreboard=board, overwrite=True)
-            loaded["__saved__"]=1
-        self.is_saved = True
+            if key is None and value is None:
+                self.scoreboards.pop(scoreboard_name, None)
+                self.removed.add(scoreboard_name) #its .json might still be around
+            elif isinstance(key, list): #a bulk change
+                board = self.scoreboards.get(scoreboard_name)
+                if board is None:
+                    board = self.scoreboards[scoreboard_name] = self._new_board({})
+                board.update(zip(key, value))
+                board["__saved__"]=0
+            elif key is None:
+                value["__saved__"]=0
+                if scoreboard_name in self.scoreboards:
+                    self.scoreboards[scoreboard_name].clear()
+                    self.scoreboards[scoreboard_name].update(value)
+                else:
+                    self.scoreboards[scoreboard_name] = self._new_board(value)
+            else:
+                board = self.scoreboards.get(scoreboard_name)
+                if board is None:
+                    board = self.scoreboards[scoreboard_name] = self._new_board({})
+                board[key] = value
+                board["__saved__"]=0 #the .json on disk is behind, so it gets rewritten at the next compaction
                 
 
     def __iter__(self, scoreboard_name = None):
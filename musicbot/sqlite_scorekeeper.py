@@ -0,0 +1,540 @@
+import os
+import sqlite3
+import threading
+from functools import wraps
+
+def locked(method):
+    """
+    Runs a SQLiteScorekeeper method under its lock, so the bot can use it from a worker thread (asyncio.to_thread) too.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class SQLiteScorekeeper:
+
+    """==========================================================================
+    Drop-in replacement for Scorekeeper that keeps every scoreboard in one SQLite database (WAL mode)
+    instead of a .json per board. Same API: change_score, set_score, get_score, get_scoreboard, add_scoreboard,
+    remove_scoreboard, top, rank_of, the group methods, save and load.
+    Every change is written (and committed) right away, and increments are a single upsert statement,
+    so there's nothing to save and no way for two increments to step on each other.
+    Scores are stored as whatever type they were given (ints, floats, or the odd string from &editscore).
+    Anything else (lists, dicts) can't go in a column, so it raises TypeError instead.
+    Import the old .json boards with migrate_scoreboards.py.
+    Generations (set_generation) work the same as in Scorekeeper: the old one gets deleted right away.
+    The connection can be used from any thread (like save() from asyncio.to_thread), with one lock around everything that touches it.
+    =============================================================================
+    """
+
+    default_path=os.path.abspath("misc_data/scores.db")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS boards (name TEXT PRIMARY KEY) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS scores (board TEXT NOT NULL, key TEXT NOT NULL, score, PRIMARY KEY (board, key)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS scores_by_score ON scores (board, score);
+    """
+
+    #RETURNING showed up in SQLite 3.35. Older versions do the same thing in two statements inside a transaction
+    HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+    GENERATIONS_BOARD = "__generations__"
+
+    def __init__(self, default_path=os.path.abspath("misc_data/scores.db")):
+        """
+        Opens (or creates) the database at default_path.
+        """
+        self.default_path = default_path
+        self.db = None
+        self.lock = threading.RLock() #one connection, so only one thread uses it at a time
+        self.generations = {} #a copy of the generations board, since every call needs it
+        self.stale = set()
+        self.load()
+
+
+    def _connect(self, path):
+        db = sqlite3.connect(path, isolation_level=None, check_same_thread=False) #autocommit. Transactions are explicit. self.lock keeps threads from sharing it at once
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL") #WAL mode is still crash-safe with this, and it's much easier on the SD card
+        db.executescript(self.SCHEMA)
+        db.execute("CREATE TEMP TABLE group_members (grp TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (grp, key)) WITHOUT ROWID")
+        db.execute("CREATE INDEX temp.group_members_by_key ON group_members (key)") #for is_marked
+        return db
+
+
+    @property
+    def is_saved(self):
+        """
+        Always True - changes go straight to the database.
+        """
+        return True
+
+
+    @property
+    @locked
+    def scoreboards(self):
+        """
+        Every scoreboard as a dict of dicts (a copy). Mostly for debugging, since it reads the whole database.
+        """
+        boards = {name: {} for (name,) in self.db.execute("SELECT name FROM boards")}
+        for board, key, score in self.db.execute("SELECT board, key, score FROM scores"):
+            boards.setdefault(board, {})[key] = score
+        return boards
+
+
+    @locked
+    def change_score(self, key, scoreboard_name, value=1, increment=True):
+        """
+        Changes a scoreboard value for a given scoreboard and key.
+        key and scoreboard_name are both strings.
+        increment specifies whether or not value should add to or replace the current score.
+        Raises TypeError if increment=True and the variable type cannot be added (+) with the value saved.
+        If no score is set for a given key, the new score will be added to the scoreboard.
+        returns the new value of the scoreboard
+        """
+        #If increment=True, make sure the value is an additive type.
+        if increment:
+            try:
+                testvalue = value+value
+            except:
+                raise TypeError("The passed-in value is not additive (type: "+str(type(value))+"). It cannot be used when increment=True")
+
+        if not isinstance(value, (int, float, str)):
+            raise TypeError("Scores have to be numbers or strings with the sqlite backend (type: "+str(type(value))+")")
+
+        scoreboard_name = self._board_name(scoreboard_name)
+        key = str(key)
+        if key == "__saved__":
+            raise ValueError("The __saved__ key is reserved, and should not be modified this way.")
+
+        self.db.execute("INSERT OR IGNORE INTO boards (name) VALUES (?)", (scoreboard_name,))
+
+        if not increment:
+            self.db.execute("INSERT INTO scores (board, key, score) VALUES (?, ?, ?) ON CONFLICT (board, key) DO UPDATE SET score = excluded.score",
+                            (scoreboard_name, key, value))
+            return value
+
+        if isinstance(value, (int, float)):
+            new_score = self._increment(scoreboard_name, key, value)
+            if new_score is not None:
+                return new_score
+
+        #strings and other oddballs get added up in python, like the json Scorekeeper does
+        old_score = self.get_score(key, scoreboard_name)
+        if old_score is None:
+            new_score = value
+        else:
+            try:
+                new_score = old_score+value
+            except:
+                raise TypeError("The given value (type: "+str(type(value))+") could not be added to the original value (type: "+str(type(old_score))+") (incompatable types probably)")
+        return self.change_score(key, scoreboard_name, value=new_score, increment=False)
+
+
+    def _increment(self, scoreboard_name, key, value):
+        """
+        Atomically adds a number to a score (creating it if needed) and returns the new score.
+        Returns None if the existing score isn't a number, in which case nothing was changed.
+        """
+        upsert = ("INSERT INTO scores (board, key, score) VALUES (?, ?, ?) "
+                  "ON CONFLICT (board, key) DO UPDATE SET score = score + excluded.score WHERE typeof(score) IN ('integer', 'real')")
+        params = (scoreboard_name, key, value)
+        if self.HAS_RETURNING:
+            row = self.db.execute(upsert+" RETURNING score", params).fetchone()
+            return row[0] if row else None
+
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            changed = self.db.execute(upsert, params).rowcount
+            row = self.db.execute("SELECT score FROM scores WHERE board = ? AND key = ?", (scoreboard_name, key)).fetchone()
+            self.db.execute("COMMIT")
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+        return row[0] if changed else None
+
+
+    @locked
+    def change_scores_bulk(self, scoreboard_name, keys, value=1, increment=True):
+        """
+        change_score for a bunch of keys at once, all with the same value, as one executemany in one transaction.
+        Raises TypeError like change_score does, in which case none of the scores get changed.
+        """
+        if increment:
+            try:
+                testvalue = value+value
+            except:
+                raise TypeError("The passed-in value is not additive (type: "+str(type(value))+"). It cannot be used when increment=True")
+        if not isinstance(value, (int, float, str)):
+            raise TypeError("Scores have to be numbers or strings with the sqlite backend (type: "+str(type(value))+")")
+
+        scoreboard_name = self._board_name(scoreboard_name)
+        rows = [(scoreboard_name, str(key), value) for key in dict.fromkeys(str(key) for key in keys)]
+        if any(key == "__saved__" for _, key, _ in rows):
+            raise ValueError("The __saved__ key is reserved, and should not be modified this way.")
+        if increment and isinstance(value, str):
+            for _, key, _ in rows: #strings get added up in python, it's not worth a special statement
+                self.change_score(key, scoreboard_name, value)
+            return
+
+        if not increment:
+            update = "excluded.score"
+        else:
+            update = "score + excluded.score WHERE typeof(score) IN ('integer', 'real')"
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("INSERT OR IGNORE INTO boards (name) VALUES (?)", (scoreboard_name,))
+            changes = self.db.total_changes
+            self.db.executemany("INSERT INTO scores (board, key, score) VALUES (?, ?, ?) ON CONFLICT (board, key) DO UPDATE SET score = "+update, rows)
+            if self.db.total_changes-changes != len(rows): #some score wasn't a number
+                raise TypeError("The given value (type: "+str(type(value))+") could not be added to one of the original values (incompatable types probably)")
+            self.db.execute("COMMIT")
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+
+
+    def mark_group(self, scoreboard_name, group, value=1):
+        """
+        Marks a whole group (like all the members of a guild) on a yes/no kind of scoreboard in one go, by setting the group's own score.
+        Check it with is_marked().
+        """
+        return self.change_score(str(group), scoreboard_name, value=value, increment=False)
+
+
+    @locked
+    def is_marked(self, scoreboard_name, key):
+        """
+        True if key has a score on the scoreboard (that isn't 0), or any group it's in does (see mark_group).
+        """
+        key = str(key)
+        row = self.db.execute("SELECT 1 FROM scores WHERE board = ? AND score != 0 AND score != '' AND "
+                              "(key = ? OR key IN (SELECT grp FROM group_members WHERE key = ?)) LIMIT 1",
+                              (self._board_name(scoreboard_name), key, key)).fetchone()
+        return row is not None
+
+
+    def set_score(self, key, scoreboard_name, value):
+        """
+        Wrapper for change_score that sets increment=False
+        """
+        return self.change_score(key, scoreboard_name, value=value, increment=False)
+
+
+    @locked
+    def get_score(self, key, scoreboard_name, show_none=True):
+        """
+        Retrieves the scoreboard value for a given scoreboard and key (both strings).
+        If no score is currently set, returns None. If show_none=False, will return 0 instead.
+        """
+        key = str(key)
+        if key == "__saved__":
+            raise ValueError("The __saved__ key is reserved, and should not be accessed this way.")
+
+        row = self.db.execute("SELECT score FROM scores WHERE board = ? AND key = ?", (self._board_name(scoreboard_name), key)).fetchone()
+        if row is None:
+            return None if show_none else 0
+        return row[0]
+
+
+    @locked
+    def get_scoreboard(self, scoreboard_name, show_none=True):
+        """
+        Returns the entire scoreboard as a dict (a copy - changing it does nothing).
+        If the specified scoreboard does not exist, it will return None. If show_none=False, it will return an empty dict instead.
+        """
+        scoreboard_name = self._board_name(scoreboard_name)
+        board = dict(self.db.execute("SELECT key, score FROM scores WHERE board = ?", (scoreboard_name,)))
+        if not board and not self.db.execute("SELECT 1 FROM boards WHERE name = ?", (scoreboard_name,)).fetchone():
+            return None if show_none else {}
+        return board
+
+
+    @locked
+    def add_scoreboard(self, scoreboard_name, new_scoreboard={}, overwrite=False):
+        """
+        Creates a new scoreboard with the values in new_scoreboard (if specified).
+        Raises ValueError if a scoreboard already exists with the same name and overwrite=False.
+        Overwrites an existing scoreboard if overwrite=True.
+        Returns the new scoreboard as a dict.
+        """
+        scoreboard_name = self._board_name(scoreboard_name)
+        rows = [(scoreboard_name, str(key), value) for key, value in new_scoreboard.items() if key != "__saved__"]
+        for _, key, value in rows:
+            if not isinstance(value, (int, float, str)):
+                raise TypeError("Scores have to be numbers or strings with the sqlite backend (type: "+str(type(value))+")")
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            if self.db.execute("SELECT 1 FROM boards WHERE name = ?", (scoreboard_name,)).fetchone():
+                if not overwrite:
+                    raise ValueError("That scoreboard already exists! Cannot add it without overwriting the existing one: "+scoreboard_name)
+                self.db.execute("DELETE FROM scores WHERE board = ?", (scoreboard_name,))
+            else:
+                self.db.execute("INSERT INTO boards (name) VALUES (?)", (scoreboard_name,))
+            self.db.executemany("INSERT INTO scores (board, key, score) VALUES (?, ?, ?)", rows)
+            self.db.execute("COMMIT")
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+        return {key: value for _, key, value in rows}
+
+
+    @locked
+    def remove_scoreboard(self, scoreboard_name):
+        """
+        Deletes a scoreboard entirely. Does nothing if it doesn't exist.
+        """
+        scoreboard_name = self._board_name(scoreboard_name)
+        self._delete_board(scoreboard_name)
+
+
+    def _delete_board(self, name):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("DELETE FROM scores WHERE board = ?", (name,))
+            self.db.execute("DELETE FROM boards WHERE name = ?", (name,))
+            self.db.execute("COMMIT")
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+
+
+    @locked
+    def total(self, scoreboard_name):
+        """
+        Returns the sum of every numeric score on a scoreboard (0 if it doesn't exist).
+        """
+        (total,) = self.db.execute("SELECT COALESCE(SUM(score), 0) FROM scores WHERE board = ? AND typeof(score) IN ('integer', 'real')",
+                                   (self._board_name(scoreboard_name),)).fetchone()
+        return total
+
+
+    @locked
+    def top(self, scoreboard_name, k, filter=None, group=None):
+        """
+        Returns the k highest (key, score)s of a scoreboard as a list, highest first. Ties go by key.
+        If group is specified, only the keys in that group are counted (see set_group).
+        If filter is specified, only keys where filter(key) is True are counted. Only numeric scores are ranked.
+        Walks the (board, score) index (or the group's members), so it only reads as many rows as it needs.
+        """
+        if k <= 0:
+            return []
+        scoreboard_name = self._board_name(scoreboard_name)
+        if group is None:
+            query = "SELECT key, score FROM scores WHERE board = ? AND typeof(score) IN ('integer', 'real') ORDER BY score DESC, key"
+            params = (scoreboard_name,)
+        else:
+            query = ("SELECT scores.key, score FROM group_members JOIN scores ON scores.board = ? AND scores.key = group_members.key "
+                     "WHERE group_members.grp = ? AND typeof(score) IN ('integer', 'real') ORDER BY score DESC, scores.key")
+            params = (scoreboard_name, str(group))
+        if filter is None:
+            return self.db.execute(query+" LIMIT ?", params+(k,)).fetchall()
+        found = []
+        for key, score in self.db.execute(query, params):
+            if filter(key):
+                found.append((key, score))
+                if len(found) >= k:
+                    break
+        return found
+
+
+    @locked
+    def leaders(self, scoreboard_name, group=None):
+        """
+        Returns the keys tied for the top score of a scoreboard (or of just a group's keys) as a frozenset.
+        Empty if the scoreboard doesn't exist or the top score is 0.
+        """
+        top = self.top(scoreboard_name, 1, group=group)
+        if not top or top[0][1] == 0:
+            return frozenset()
+        scoreboard_name = self._board_name(scoreboard_name)
+        if group is None:
+            rows = self.db.execute("SELECT key FROM scores WHERE board = ? AND score = ? AND typeof(score) IN ('integer', 'real')",
+                                   (scoreboard_name, top[0][1]))
+        else:
+            rows = self.db.execute("SELECT scores.key FROM group_members JOIN scores ON scores.board = ? AND scores.key = group_members.key "
+                                   "WHERE group_members.grp = ? AND score = ? AND typeof(score) IN ('integer', 'real')",
+                                   (scoreboard_name, str(group), top[0][1]))
+        return frozenset(key for (key,) in rows)
+
+
+    @locked
+    def rank_of(self, scoreboard_name, key, group=None):
+        """
+        Returns key's rank on a scoreboard (1 is the top, and ties share a rank), or None if it has no numeric score there.
+        If group is specified, the rank is among that group only (and None if key isn't in it).
+        """
+        key = str(key)
+        scoreboard_name = self._board_name(scoreboard_name)
+        score = self.get_score(key, scoreboard_name)
+        if not isinstance(score, (int, float)):
+            return None
+        if group is None:
+            (better,) = self.db.execute("SELECT COUNT(*) FROM scores WHERE board = ? AND score > ? AND typeof(score) IN ('integer', 'real')",
+                                        (scoreboard_name, score)).fetchone()
+            return better + 1
+        group = str(group)
+        if not self.db.execute("SELECT 1 FROM group_members WHERE grp = ? AND key = ?", (group, key)).fetchone():
+            return None
+        (better,) = self.db.execute("SELECT COUNT(*) FROM group_members JOIN scores ON scores.board = ? AND scores.key = group_members.key "
+                                    "WHERE group_members.grp = ? AND score > ? AND typeof(score) IN ('integer', 'real')",
+                                    (scoreboard_name, group, score)).fetchone()
+        return better + 1
+
+
+    @locked
+    def set_generation(self, scoreboard_name, generation):
+        """
+        Starts a new generation of a scoreboard that gets reset every so often (like the daily goku attempts):
+        from now on, scoreboard_name means a fresh board that's stored as scoreboard_name@generation.
+        The old generation gets deleted right away.
+        """
+        old_name = self._board_name(scoreboard_name)
+        self.set_score(scoreboard_name, self.GENERATIONS_BOARD, str(generation))
+        self.generations[scoreboard_name] = str(generation)
+        if self._board_name(scoreboard_name) != old_name:
+            self._delete_board(old_name)
+
+
+    def _board_name(self, scoreboard_name):
+        generation = self.generations.get(scoreboard_name)
+        return scoreboard_name if generation is None else scoreboard_name+"@"+generation
+
+
+    def _find_stale(self):
+        board_names = [name for (name,) in self.db.execute("SELECT name FROM boards")]
+        for name in self.generations:
+            current = self._board_name(name)
+            for board_name in board_names:
+                if board_name != current and (board_name == name or board_name.startswith(name+"@")):
+                    self.stale.add(board_name)
+
+
+    @locked
+    def set_group(self, group, keys):
+        """
+        Sets (or replaces) the keys in a group, like the members of a guild, for top() and rank_of().
+        Groups live in a temp table, so they're not saved.
+        """
+        group = str(group)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("DELETE FROM group_members WHERE grp = ?", (group,))
+            self.db.executemany("INSERT OR IGNORE INTO group_members (grp, key) VALUES (?, ?)", [(group, str(key)) for key in keys])
+            self.db.execute("COMMIT")
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+
+
+    @locked
+    def join_group(self, group, key):
+        self.db.execute("INSERT OR IGNORE INTO group_members (grp, key) VALUES (?, ?)", (str(group), str(key)))
+
+
+    @locked
+    def leave_group(self, group, key):
+        self.db.execute("DELETE FROM group_members WHERE grp = ? AND key = ?", (str(group), str(key)))
+
+
+    @locked
+    def remove_group(self, group):
+        self.db.execute("DELETE FROM group_members WHERE grp = ?", (str(group),))
+
+
+    @locked
+    def save(self, path=None, force_all=False):
+        """
+        Changes are already saved as they happen. force_all=True folds the WAL back into the main database file
+        (handy right before a backup or a reboot).
+        """
+        if force_all:
+            for name in self.stale: #old generations
+                self._delete_board(name)
+            self.stale.clear()
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+    def flush(self, path=None):
+        """
+        Nothing to flush.
+        """
+        pass
+
+
+    def start_writer(self, interval=5):
+        """
+        There's no writer thread - SQLite writes every change as it happens. Here so the backends can be swapped.
+        """
+        pass
+
+
+    def stop_writer(self):
+        pass
+
+
+    def needs_compaction(self, path=None):
+        """
+        Never - SQLite checkpoints its own WAL.
+        """
+        return False
+
+
+    @locked
+    def load(self, path=None, clear_old=True):
+        """
+        (Re)opens the database at the specified path (uses the default_path the SQLiteScorekeeper was made with if unspecified).
+        There's nothing to read into memory, so clear_old doesn't matter. Groups are kept.
+        """
+        path = path if path else self.default_path
+        group_members = []
+        if self.db is not None:
+            group_members = self.db.execute("SELECT grp, key FROM group_members").fetchall()
+            self.db.close()
+        self.db = self._connect(path)
+        self.db.executemany("INSERT INTO group_members (grp, key) VALUES (?, ?)", group_members)
+        self.generations = dict(self.db.execute("SELECT key, score FROM scores WHERE board = ?", (self.GENERATIONS_BOARD,)))
+        self.stale = set()
+        self._find_stale()
+
+
+    @locked
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+    @locked
+    def import_scoreboards(self, scoreboards, overwrite=False):
+        """
+        Copies a dict of scoreboards (like Scorekeeper.scoreboards) into the database in one transaction.
+        Boards that already exist are skipped unless overwrite=True. Returns the names of the boards that were imported.
+        """
+        imported = []
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            for name, board in scoreboards.items():
+                if self.db.execute("SELECT 1 FROM boards WHERE name = ?", (name,)).fetchone():
+                    if not overwrite:
+                        continue
+                    self.db.execute("DELETE FROM scores WHERE board = ?", (name,))
+                else:
+                    self.db.execute("INSERT INTO boards (name) VALUES (?)", (name,))
+                rows = []
+                for key, value in board.items():
+                    if key == "__saved__":
+                        continue
+                    if not isinstance(value, (int, float, str)):
+                        print("Skipping "+name+" score for "+str(key)+", the sqlite backend can't store a "+str(type(value)))
+                        continue
+                    rows.append((name, str(key), value))
+                self.db.executemany("INSERT INTO scores (board, key, score) VALUES (?, ?, ?)", rows)
+                imported.append(name)
+            self.db.execute("COMMIT")
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+        return imported
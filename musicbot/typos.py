@@ -0,0 +1,106 @@
+"""
+Realistic typo injection for the bot's chat responses.
+
+Typos come from an approximation of a qwerty keyboard: a typoed letter slides one key left/right or one row up/down.
+Every letter, "!" and space outside of curly braces has a `sloppiness` chance of getting a typo, and a typoed letter
+keeps sliding with the same chance each step. Instead of rolling the dice for every single character, the gap to the
+next typo is drawn directly from the matching geometric distribution, so a clean message costs one random draw
+instead of one per character, with the same odds per character as before.
+"""
+
+import math
+import random
+
+KEYBOARD = ["qwertyuiop[","aasdfghjkl;","zzxcvbnm,./"]
+
+
+def _build_neighbours(keyboard):
+    """
+    Maps every key to the six equally likely places one slip can land on:
+    left, same, right (same row) then up, same, down (same column). Keys that show up twice use their first spot.
+    """
+    neighbours = {}
+    for row in keyboard:
+        for letter in row:
+            if letter in neighbours:
+                continue
+            y = 0 if letter in keyboard[0] else (1 if letter in keyboard[1] else 2)
+            x = keyboard[y].index(letter)
+            landing = []
+            for dx in (-1, 0, 1):
+                landing.append(keyboard[y][max(0, min(x+dx, len(keyboard[y])-1))])
+            for dy in (-1, 0, 1):
+                row_y = max(0, min(y+dy, len(keyboard)-1))
+                landing.append(keyboard[row_y][max(0, min(x, len(keyboard[row_y])-1))])
+            neighbours[letter] = tuple(landing)
+    return neighbours
+
+
+NEIGHBOURS = _build_neighbours(KEYBOARD)
+
+
+def typo_positions(text, sloppiness):
+    """
+    Returns the indexes of text that are allowed to get a typo: keyboard letters, "!" and spaces that aren't
+    inside curly braces (so response tags like {break} never get broken). Keyboard letters are left out when
+    sloppiness >= 1 (the old behaviour).
+    """
+    positions = []
+    inkey = False
+    previous = ""
+    letters_allowed = sloppiness < 1
+    for i, letter in enumerate(text):
+        if letter == "{":
+            inkey = True
+        if previous == "}":
+            inkey = False
+        previous = letter
+        if inkey:
+            continue
+        if letter in NEIGHBOURS:
+            if letters_allowed:
+                positions.append(i)
+        elif letter == "!" or letter == " ":
+            positions.append(i)
+    return positions
+
+
+def add_typos(text, sloppiness, rng=random):
+    """
+    Inserts realistic typos into text. sloppiness is the chance of a typo per eligible character (range of [0,1)).
+    Does its best not to affect newlines and anything inside curly-braces (i.e. won't break response tags).
+    rng can be any random.Random (defaults to the global one).
+    """
+    if sloppiness <= 0:
+        return text
+
+    output = list(text)
+    positions = typo_positions(text, sloppiness)
+    log_miss = math.log(1-sloppiness) if sloppiness < 1 else None
+    i = _next_gap(rng, log_miss)
+    while i < len(positions):
+        index = positions[i]
+        letter = output[index]
+        if letter == "!":
+            output[index] = "1"
+        elif letter == " ":
+            output[index] = rng.choice(["","  "])
+        else:
+            letter = rng.choice(NEIGHBOURS[letter])
+            while rng.random() < sloppiness: #keep sliding around the keyboard
+                letter = rng.choice(NEIGHBOURS[letter])
+            output[index] = letter
+        i += 1 + _next_gap(rng, log_miss)
+
+    if rng.random() <= sloppiness: #sometimes add an apostrophe to the end because of a missed return key
+        output.append("'")
+    return "".join(output)
+
+
+def _next_gap(rng, log_miss):
+    """
+    Number of eligible characters to skip before the next typo (geometric, counting the misses before a hit).
+    """
+    if log_miss is None: #sloppiness >= 1, everything gets hit
+        return 0
+    return int(math.log(1.0-rng.random()) / log_miss)
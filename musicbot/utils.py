@@ -59,6 +59,23 @@ def paginate(content, *, length=DISCORD_MSG_CHAR_LIMIT, reserve=0):
     return chunks
 
 
+def merge_segments(segments, *, length=DISCORD_MSG_CHAR_LIMIT):
+    """
+    Merges adjacent (text, delete_after) segments with the same delete_after into one message, as long as the result
+    stays within the message length limit. Blank segments are dropped (discord won't send them anyway).
+    Returns a new list of (text, delete_after) tuples in the original order.
+    """
+    merged = []
+    for text, delete_after in segments:
+        if not text.strip():
+            continue
+        if merged and merged[-1][1] == delete_after and len(merged[-1][0]) + len(text) + 1 <= length:
+            merged[-1] = (merged[-1][0] + '\n' + text, delete_after)
+        else:
+            merged.append((text, delete_after))
+    return merged
+
+
 async def get_header(session, url, headerfield=None, *, timeout=5):
     req_timeout = aiohttp.ClientTimeout(total = timeout)
     async with session.head(url, timeout = req_timeout) as response:
@@ -0,0 +1,36 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+os.makedirs("logs", exist_ok=True) #musicbot/__init__.py opens its log file on import
+allow_requests = True #quantumrandom uses requests. We never call it here
+from musicbot.sqlite_scorekeeper import SQLiteScorekeeper
+
+class SQLiteScorekeeperThreadTest(unittest.TestCase):
+
+    """
+    The bot saves the scorekeeper with asyncio.to_thread before a reboot, so the sqlite backend has to work from another thread.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.scorekeeper = SQLiteScorekeeper(os.path.join(self.folder.name, "scores.db"))
+
+    def tearDown(self):
+        self.scorekeeper.close()
+        self.folder.cleanup()
+
+    def test_save_from_thread(self):
+        self.scorekeeper.change_score("1", "goku", 3)
+        self.scorekeeper.set_generation("goku", "2026-10-17")
+        self.scorekeeper.change_score("1", "goku", 1)
+
+        asyncio.run(asyncio.to_thread(self.scorekeeper.save, force_all=True))
+
+        self.assertEqual(self.scorekeeper.get_score("1", "goku"), 1)
+        self.assertNotIn("goku", self.scorekeeper.scoreboards) #the old generation got pruned by the save
+
+
+if __name__ == "__main__":
+    unittest.main()